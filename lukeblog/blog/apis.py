@@ -1,23 +1,98 @@
 """ API接口的View层（序列化配置来自serializers.py，数据来自QuerySet对象） """
 from rest_framework import viewsets  # 更抽象的View
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404  # 与get_object相同，pk格式不对时也返回404
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 # from rest_framework.permissions import IsAdminUser  # 权限许可
 
+from .conditional import ConditionalGetMixin, make_validators
 from .models import Post, Category
-from .serializers import PostSerializer, PostDetailSerializer, CategorySerializer, CategoryDetailSerializer
+from .pagination import PostCursorPagination
+from .renderers import FastJSONRenderer
+from .search import search_index
+from .suggest import suggest_index
+from .watermark import post_watermark, category_watermark
+from .serializers import (
+    PostSerializer, PostDetailSerializer, CategorySerializer, CategoryDetailSerializer,
+    post_rows, post_row_data, post_url_template, annotate_post_stats, category_posts,
+)
 
 
-class PostViewSet(viewsets.ReadOnlyModelViewSet):  # 只读，若需写入，应继承自viewsets.ModelViewSet
+class APIConditionalGetMixin(ConditionalGetMixin):
+    """ 同一URL可能按Accept头返回JSON或可浏览的网页（其中有当前用户名），因此校验值中加入Accept和用户id """
+    def get_validators(self):
+        action = self.action_map.get('get')
+        if action == 'list':
+            timestamps = self.get_list_timestamps()
+        elif action == 'retrieve':
+            timestamps = self.get_detail_timestamps()
+        else:
+            return None
+        if timestamps is None:
+            return None
+        return make_validators(timestamps, self.request.META.get('HTTP_ACCEPT', ''), self.request.user.pk)
+
+    def get_list_timestamps(self):
+        return None
+
+    def get_detail_timestamps(self):
+        return None
+
+
+class PostViewSet(APIConditionalGetMixin, viewsets.ReadOnlyModelViewSet):  # 只读，若需写入，应继承自viewsets.ModelViewSet
     """ 文章列表及详情页API接口（DocString） """
     serializer_class = PostSerializer  # 这里的序列化参数里没有content_html字段（即正文），用于显示文章列表
     queryset = Post.objects.filter(status=Post.STATUS_NORMAL)
+    pagination_class = PostCursorPagination  # 游标分页，兼容 ?limit=&offset=
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     # permission_classes = [IsAdminUser]  # 写入时的权限校验,并在客户端增加CSRF_TOKEN的获取
 
+    def list(self, request, *args, **kwargs):
+        """ 文章列表：只读接口不经过序列化类，直接由values()的结果生成与PostSerializer相同的数据（见serializers.post_rows） """
+        queryset = post_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        url_template = post_url_template(request, self.format_kwarg)
+        data = [post_row_data(row, url_template) for row in (queryset if page is None else page)]
+        return Response(data) if page is None else self.get_paginated_response(data)
+
     def retrieve(self, request, *args, **kwargs):
-        """ 文章详情页的API接口(对应前端Post Instance) """
-        # 通过覆写父类中的serializer_class，改变详情页序列化参数（位于serializers.py），以增加字段content_html
-        self.serializer_class = PostDetailSerializer
-        return super().retrieve(request, *args, **kwargs)
+        """ 文章详情页的API接口(对应前端Post Instance)，输出与PostDetailSerializer相同，多了content_html字段 """
+        queryset = post_rows(self.filter_queryset(self.get_queryset()), detail=True)
+        row = get_object_or_404(queryset, pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return Response(post_row_data(row))
+
+    def get_serializer_class(self):
+        """ 序列化类只用于生成API文档（schema） """
+        return PostDetailSerializer if self.action == 'retrieve' else PostSerializer
+
+    def get_list_timestamps(self):
+        return [post_watermark.get(), category_watermark.get()]
+
+    def get_detail_timestamps(self):
+        """ 只查询该文章的updated_time，文章不存在时不做条件判断，由retrieve返回404 """
+        try:
+            queryset = self.get_queryset().filter(pk=self.kwargs.get('pk'))
+        except (TypeError, ValueError):
+            return None
+        updated_time = queryset.values_list('updated_time', flat=True).first()
+        return None if updated_time is None else [updated_time, category_watermark.get()]
+
+    @action(detail=False)
+    def hot(self, request):
+        """ 热门文章Top-N列表（/api/post/hot/），直接读取热门排行，不查询文章表 """
+        return Response([
+            {
+                'url': reverse('api-post-detail', args=[entry['id']], request=request),
+                'id': entry['id'],
+                'title': entry['title'],
+                'pv': entry['pv'],
+                'uv': entry['uv'],
+            }
+            for entry in Post.hot_posts()
+        ])
 
     def filter_queryset(self, queryset):
         """ 获取某个分类下的文章列表的接口 """
@@ -27,11 +102,91 @@ class PostViewSet(viewsets.ReadOnlyModelViewSet):  # 只读，若需写入，应
         return queryset
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    """ 分类数据API接口（DocString） """
+class CategoryViewSet(APIConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    分类数据API接口（DocString），列表中每个分类带有文章数，?include=posts&posts_limit=5 时附带每个分类最新的5篇文章
+    （?limit=&offset= 仍是分类列表本身的分页参数）
+    """
     serializer_class = CategorySerializer
     queryset = Category.objects.filter(status=Category.STATUS_NORMAL)
+    posts_limit = 5  # ?include=posts 时每个分类默认附带的文章数
+    max_posts_limit = 20
+
+    def get_queryset(self):
+        return annotate_post_stats(super().get_queryset(), self.get_posts_limit())
+
+    def get_posts_limit(self):
+        """ 只有列表请求?include=posts时返回大于0的数 """
+        include = self.request.query_params.get('include', '').split(',')
+        if self.action_map.get('get') != 'list' or 'posts' not in include:
+            return 0
+        try:
+            limit = int(self.request.query_params.get('posts_limit', self.posts_limit))
+        except ValueError:
+            limit = self.posts_limit
+        return max(1, min(limit, self.max_posts_limit))
+
+    def list(self, request, *args, **kwargs):
+        """ 分类数（一条查询，含文章数）+ 各分类的文章（一条查询），查询次数与分类数无关 """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        categories = list(queryset) if page is None else page
+        data = self.get_serializer(categories, many=True).data
+        if self.get_posts_limit():
+            posts = category_posts(categories, post_url_template(request, self.format_kwarg))
+            for item in data:
+                item['posts'] = posts[item['id']]
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+    def get_list_timestamps(self):
+        """ 列表中有文章数（以及文章），因此也依赖文章 """
+        return [category_watermark.get(), post_watermark.get()]
+
+    def get_detail_timestamps(self):
+        """ 分类详情中有该分类下的文章列表 """
+        return [category_watermark.get(), post_watermark.get()]
 
     def retrieve(self, request, *args, **kwargs):
         self.serializer_class = CategoryDetailSerializer
         return super().retrieve(request, *args, **kwargs)
+
+
+class SearchViewSet(viewsets.ViewSet):
+    """ 站内搜索API接口（/api/search/?q=关键字&limit=10），结果按相关度排序 """
+    queryset = Post.objects.filter(status=Post.STATUS_NORMAL)
+
+    def list(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        ranked = search_index.search(query, limit)
+        posts = self.queryset.in_bulk([post_id for post_id, score in ranked])
+        return Response([
+            {
+                'url': reverse('api-post-detail', args=[post_id], request=request),
+                'id': post_id,
+                'title': posts[post_id].title,
+                'desc': posts[post_id].desc,
+                'score': round(score, 4),
+            }
+            for post_id, score in ranked if post_id in posts
+        ])
+
+
+class SuggestViewSet(viewsets.ViewSet):
+    """ 搜索建议API接口（/api/suggest/?q=前缀&limit=5），返回标题、标签、分类名以该前缀开头的公开内容 """
+    queryset = Post.objects.filter(status=Post.STATUS_NORMAL)
+    url_names = {'post': 'api-post-detail', 'category': 'api-category-detail', 'tag': 'tag-list'}
+
+    def list(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+        except ValueError:
+            limit = None
+        result = suggest_index.suggest(request.query_params.get('q', '')[:50], limit)
+        for kind, items in result.items():
+            for item in items:
+                item['url'] = reverse(self.url_names[kind], args=[item['id']], request=request)
+        return Response(result)
@@ -0,0 +1,27 @@
+""" 系统检查（python manage.py check、runserver、migrate等命令启动时执行） """
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+
+@register()
+def check_site_url(app_configs, **kwargs):
+    """ 站点地图和RSS预先生成，链接的域名只能来自SITE_URL，未设置时启动即报错，而不是发布指向错误域名的文件 """
+    if settings.SITE_URL:
+        return []
+    return [Error(
+        '没有设置SITE_URL',
+        hint="在settings中设置站点的完整地址，如SITE_URL = 'https://www.example.com'",
+        id='blog.E001',
+    )]
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """ 缓存失效（修改时间水位、世代号、整页缓存的清除）依赖各进程共享缓存，进程内缓存只适合单进程运行 """
+    if settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        '默认缓存是进程内的LocMemCache，多进程部署时其他进程的缓存不会失效，会返回过期的页面',
+        hint='在settings的CACHES中使用FileBasedCache（单机）、Memcached或Redis等各进程共享的缓存',
+        id='blog.W001',
+    )]
@@ -0,0 +1,68 @@
+""" 站点公共部分（顶部导航、底部分类、侧边栏HTML）的快照：进程内副本 + 共享缓存，按世代号失效 """
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from config.models import SideBar
+
+from .generation import CacheGeneration
+from .models import Category
+
+SNAPSHOT_KEY = 'chrome:snapshot:%s'
+
+
+class ChromeSnapshot:
+    """
+    分类、侧边栏、文章、评论、友链发生变化时由信号调用invalidate()使世代号加1，各进程发现世代号变化后重新读取/生成快照。
+    "最新文章"、"最热文章"侧边栏的内容还会随访问变化，因此快照最多保留timeout秒。
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._local = None  # (世代号, 生成时间, 快照, 快照摘要)
+        self._generation = CacheGeneration('chrome:generation')
+
+    def get(self):
+        """ 返回{'navs', 'categories', 'sidebars'}，可直接更新到模板上下文中 """
+        return self._current()[2]
+
+    def digest(self):
+        """ 快照内容的摘要，内容不变时摘要不变（用于整页缓存的键） """
+        return self._current()[3]
+
+    def _current(self):
+        generation = self.generation()
+        local = self._local
+        if local and local[0] == generation and time.time() - local[1] < self.timeout:
+            return local
+
+        key = SNAPSHOT_KEY % generation
+        cached = cache.get(key)
+        if cached is None:
+            snapshot = self.build()
+            cached = (time.time(), snapshot, hashlib.md5(repr(snapshot).encode('utf-8')).hexdigest())
+            cache.set(key, cached, self.timeout)
+        self._local = (generation,) + cached
+        return self._local
+
+    def build(self):
+        """ 查询数据库并渲染侧边栏，生成一份快照 """
+        navs = Category.get_navs()
+        return {
+            'navs': [{'id': cate.id, 'name': cate.name} for cate in navs['navs']],
+            'categories': [{'id': cate.id, 'name': cate.name} for cate in navs['categories']],
+            'sidebars': [
+                {'title': sidebar.title, 'content_html': sidebar.content_html}
+                for sidebar in SideBar.get_all()
+            ],
+        }
+
+    def generation(self):
+        return self._generation.get()
+
+    def invalidate(self):
+        self._generation.bump()
+
+
+chrome = ChromeSnapshot(settings.CHROME_SNAPSHOT_TIMEOUT)
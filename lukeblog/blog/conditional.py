@@ -0,0 +1,47 @@
+""" 条件GET：先用廉价的校验值（ETag/Last-Modified）判断客户端缓存是否仍然有效，有效时直接返回304，不做查询和渲染 """
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_validators(timestamps, *parts):
+    """ 由依赖数据的修改时间和其他影响页面内容的值生成(etag, last_modified) """
+    raw = '|'.join(str(part) for part in list(timestamps) + list(parts))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest(), max(timestamps)
+
+
+def conditional_response(request, get_validators, get_response):
+    """
+    get_validators()返回(etag, last_modified)，返回None表示不做条件判断（如对象不存在，交给视图返回404）；
+    客户端缓存仍有效时返回304，否则调用get_response()生成响应，成功的响应（包括Range请求的206）都附上校验值
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return get_response()
+    validators = get_validators()
+    if validators is None:
+        return get_response()
+
+    etag, last_modified = validators
+    etag = quote_etag(etag)
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 206, 304):
+        if not response.has_header('ETag'):
+            response['ETag'] = etag
+        if timestamp and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class ConditionalGetMixin:
+    """ 用于类视图（包括DRF的视图集），子类实现get_validators()，此时self.request、self.kwargs已经可用 """
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super().dispatch
+        return conditional_response(request, self.get_validators, lambda: dispatch(request, *args, **kwargs))
+
+    def get_validators(self):
+        return None
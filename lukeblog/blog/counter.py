@@ -0,0 +1,145 @@
+""" 文章pv/uv计数缓冲：在内存中累积各文章的增量，按周期用一条UPDATE批量写回数据库（write-behind） """
+import atexit
+import logging
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+
+class VisitCounter:
+    """
+    累积每篇文章的pv/uv增量，满足以下任一条件时批量写回：
+    1. 距上次写回超过flush_interval秒（有访问时顺带检查，空闲时由定时器补写）
+    2. 累积的增量达到max_pending（即进程异常退出时最多丢失max_pending个增量）
+    3. 进程正常退出（atexit）
+    """
+    def __init__(self, flush_interval, max_pending):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # {post_id: [pv增量, uv增量]}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def incr(self, post_id, pv=0, uv=0):
+        """ 记录一次访问的增量，不直接访问数据库 """
+        if not (pv or uv):
+            return
+        with self._lock:
+            delta = self._pending.setdefault(post_id, [0, 0])
+            delta[0] += pv
+            delta[1] += uv
+            self._pending_count += pv + uv
+            due = (self._pending_count >= self.max_pending
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+        else:
+            self._schedule()
+
+    def get_delta(self, post_id):
+        """ 返回尚未写回数据库的(pv增量, uv增量)，供读取端叠加显示 """
+        with self._lock:
+            pv, uv = self._pending.get(post_id, (0, 0))
+        return pv, uv
+
+    def flush(self):
+        """ 将累积的增量用一条UPDATE写回数据库，返回{post_id: (pv增量, uv增量)} """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return {}
+
+        from .models import Post  # 避免循环引用
+        try:
+            Post.objects.filter(pk__in=list(pending)).update(
+                pv=F('pv') + self._delta_case(pending, 0),
+                uv=F('uv') + self._delta_case(pending, 1),
+            )
+        except DatabaseError:
+            # 写回失败时将增量放回缓冲，等待下一次写回
+            logger.exception('flush pv/uv failed')
+            self._merge_back(pending)
+            return {}
+
+        from .ranking import hot_ranking
+        hot_ranking.update_posts(list(pending))  # 热门排行随计数写回增量更新
+        return {post_id: tuple(delta) for post_id, delta in pending.items()}
+
+    @staticmethod
+    def _delta_case(pending, index):
+        """ 构造 CASE id WHEN 1 THEN 3 WHEN 2 THEN 1 ... ELSE 0 END，使一条UPDATE可以为每篇文章加上不同的增量 """
+        whens = [When(pk=post_id, then=Value(delta[index])) for post_id, delta in pending.items() if delta[index]]
+        return Case(*whens, default=Value(0), output_field=IntegerField())
+
+    def _merge_back(self, pending):
+        with self._lock:
+            for post_id, (pv, uv) in pending.items():
+                delta = self._pending.setdefault(post_id, [0, 0])
+                delta[0] += pv
+                delta[1] += uv
+                self._pending_count += pv + uv
+
+    def _schedule(self):
+        """ 启动一个定时器，保证空闲时最后一批增量也能在flush_interval秒内写回 """
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.flush_interval, self._timer_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timer_flush(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connections.close_all()  # 定时器线程中打开的数据库连接需要手动关闭
+
+
+visit_counter = VisitCounter(settings.PVUV_FLUSH_INTERVAL, settings.PVUV_MAX_PENDING)
+atexit.register(visit_counter.flush)  # 进程退出前写回剩余的增量
+
+
+def count_unique_visitor(post_id, uid):
+    """
+    将uid加入该文章当天的HyperLogLog草图，返回uv应增加的数量（通常为0或1）。
+    草图中同时记录已经计入Post.uv的估计值，每次只累加估计值的增长部分，因此一天结束时计入的总数即为草图的估计值，
+    误差见HyperLogLog的说明；多个进程同时写同一个草图时可能丢失少量更新，只会导致uv略微偏少。
+    """
+    key = 'uv_hll:%s:%s' % (post_id, date.today())
+    registers, counted = cache.get(key) or (None, 0)
+    hll = HyperLogLog(settings.UV_HLL_PRECISION, registers)
+    if not hll.add(uid):
+        return 0  # 该uid今天很可能已经计算过
+    estimate = hll.count()
+    increment = max(estimate - counted, 0)
+    cache.set(key, (hll.to_bytes(), counted + increment), 25 * 60 * 60)  # 比一天略长，避免跨零点时提前过期
+    return increment
+
+
+def record_visit(post_id, uid):
+    """ 记录uid对文章的一次访问：同一uid一分钟内重复访问不增加pv，uv由当天的HyperLogLog草图去重 """
+    increase_pv = False
+    pv_key = 'pv:%s:%s' % (uid, post_id)
+    if not cache.get(pv_key):
+        increase_pv = True
+        cache.set(pv_key, 1, 1*60)  # 1分钟有效
+
+    increase_uv = count_unique_visitor(post_id, uid)
+
+    # 增量先累积在内存中，由visit_counter按周期批量写回数据库
+    visit_counter.incr(post_id, pv=int(increase_pv), uv=increase_uv)
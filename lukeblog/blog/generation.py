@@ -0,0 +1,23 @@
+""" 保存在共享缓存中的世代号：数据变化时加1，各进程比较世代号即可判断自己的本地副本是否过期 """
+import time
+
+from django.core.cache import cache
+
+
+class CacheGeneration:
+    def __init__(self, key):
+        self.key = key
+
+    def get(self):
+        generation = cache.get(self.key)
+        if generation is None:
+            # 世代号丢失（如缓存重启）时用当前时间作为初值，避免与进程内旧副本的世代号重复
+            cache.add(self.key, int(time.time() * 1000), None)
+            generation = cache.get(self.key)
+        return generation
+
+    def bump(self):
+        try:
+            cache.incr(self.key)
+        except ValueError:  # 世代号不存在
+            self.get()
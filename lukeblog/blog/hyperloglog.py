@@ -0,0 +1,38 @@
+""" HyperLogLog基数估计：用固定大小的内存统计"有多少个不同的uid" """
+import hashlib
+import math
+
+
+class HyperLogLog:
+    """
+    m = 2**precision 个寄存器，每个寄存器占1字节，即每个草图固定占用m字节。
+    估计值的标准误差约为 1.04 / sqrt(m)，如precision=10时占用1KB，误差约3.25%；precision=12时占用4KB，误差约1.6%。
+    """
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value):
+        """ 加入一个元素，返回True表示草图发生了变化（该元素一定是新出现的），False表示它很可能已经出现过 """
+        x = int.from_bytes(hashlib.sha1(str(value).encode('utf-8')).digest()[:8], 'big')  # 取64位哈希
+        bits = 64 - self.precision
+        index = x >> bits  # 高precision位决定寄存器
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1  # 剩余位中第一个1出现的位置
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def count(self):
+        """ 返回基数估计值 """
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # 基数较小时使用线性计数修正
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
@@ -0,0 +1,179 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from blog.chrome import chrome
+from blog.models import Post
+from blog.ranking import hot_ranking
+from comment.models import Comment
+from comment.recent import recent_comments
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')  # 没有USING INDEX的SCAN为全表扫描
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = (
+        '请求各个常用页面和API，对它们执行的每条查询做EXPLAIN，报告全表扫描和临时排序（SQLite的TEMP B-TREE、'
+        'PostgreSQL的Sort、MySQL的Using temporary/filesort）；出现不在QUERY_PLAN_ALLOWLIST中的问题时失败'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='输出每条查询及其执行计划')
+
+    def handle(self, *args, **options):
+        explain = {
+            'sqlite': self.explain_sqlite,
+            'postgresql': self.explain_postgresql,
+            'mysql': self.explain_mysql,
+        }.get(connection.vendor)
+        if explain is None:
+            raise CommandError('不支持的数据库：%s' % connection.vendor)
+
+        allowlist = set(settings.QUERY_PLAN_ALLOWLIST)
+        self.tables = set(connection.introspection.table_names())  # 子查询产生的临时表的扫描不计入
+        plans = {}  # {(sql, params): [(表, 问题), ...]}，不同页面执行的相同查询只EXPLAIN一次
+        regressions = set()
+        for url, func in self.targets():
+            for sql, params in self.capture(url, func):
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                key = (sql, tuple(params))
+                if key not in plans:
+                    plans[key] = explain(sql, params, options['verbose_plans'])
+                for table, problem in plans[key]:
+                    finding = '%s:%s' % (table, problem)
+                    allowed = finding in allowlist
+                    if not allowed:
+                        regressions.add(finding)
+                    style = self.style.WARNING if allowed else self.style.ERROR
+                    self.stdout.write(style('%s  %s%s' % (url, finding, '（已允许）' if allowed else '')))
+                    if options['verbose_plans'] or not allowed:
+                        self.stdout.write('    %s' % sql)
+
+        if regressions:
+            raise CommandError('发现%d个不在QUERY_PLAN_ALLOWLIST中的问题：%s' % (
+                len(regressions), ', '.join(sorted(regressions))))
+        self.stdout.write(self.style.SUCCESS('检查了%d条查询，没有新的全表扫描或临时排序' % len(plans)))
+
+    def targets(self):
+        """
+        返回[(名称, 函数), ...]：各个常用页面、API，以及页面从缓存中读取、缓存失效时才重建的数据
+        （进程内已有副本时请求页面不会执行这些查询，因此单独检查）
+        """
+        client = Client()
+        targets = [(url, lambda url=url: self.get(client, url)) for url in self.urls()]
+        return targets + [
+            ('chrome.build', chrome.build),  # 导航、侧边栏
+            ('hot_ranking.rebuild', hot_ranking.rebuild),
+            ('recent_comments.rebuild', recent_comments.rebuild),
+        ]
+
+    @staticmethod
+    def get(client, url):
+        response = client.get(url)
+        if response.status_code >= 400:
+            raise CommandError('%s 返回%s' % (url, response.status_code))
+
+    @staticmethod
+    def urls():
+        """ 用数据库中的数据填充各个常用页面、API的路径 """
+        post = Post.objects.filter(status=Post.STATUS_NORMAL).values('id', 'category_id', 'owner_id').first()
+        if post is None:
+            raise CommandError('没有已发布的文章，无法检查文章相关的页面')
+        tag_id = Post.tag.through.objects.filter(post_id=post['id']).values_list('tag_id', flat=True).first()
+        urls = [
+            '/',
+            '/?page=2',
+            '/category/%s/' % post['category_id'],
+            '/author/%s' % post['owner_id'],
+            '/post/%s.html' % post['id'],
+            '/search/?keyword=a',
+            '/links/',
+            '/comments/?target=/post/%s.html&page=1' % post['id'],
+            '/api/post/',
+            '/api/post/%s/' % post['id'],
+            '/api/post/?category=%s' % post['category_id'],
+            '/api/category/',
+            '/api/category/?include=posts',
+            '/api/category/%s/' % post['category_id'],
+            '/api/suggest/?q=a',
+        ]
+        if tag_id is not None:
+            urls.append('/tag/%s/' % tag_id)
+        comment = Comment.objects.exclude(target='').values_list('target', flat=True).first()
+        if comment and Comment.post_id_of(comment) is None:
+            urls.append('/comments/?target=%s&page=1' % comment)  # 非文章页面的评论按target查询
+        return urls
+
+    @staticmethod
+    def capture(name, func):
+        """ 调用func（如以匿名用户请求页面），返回执行的[(sql, params), ...]；期间不使用缓存，否则缓存命中时没有查询 """
+        queries = []
+
+        def wrapper(execute, sql, params, many, context):
+            queries.append((sql, params or ()))
+            return execute(sql, params, many, context)
+
+        dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(CACHES=dummy_cache, ALLOWED_HOSTS=['*'], DEBUG=False):
+            with connection.execute_wrapper(wrapper):
+                func()
+        return queries
+
+    def explain_sqlite(self, sql, params, verbose):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        self.show_plan(details, verbose)
+        problems = []
+        for detail in details:
+            match = SQLITE_SCAN_RE.match(detail)
+            if match and match.group(1) in self.tables:
+                problems.append((match.group(1), 'scan'))
+            elif 'USE TEMP B-TREE' in detail:
+                problems.append((self.main_table(sql), 'temp-b-tree'))
+        return problems
+
+    def explain_postgresql(self, sql, params, verbose):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            details = [row[0] for row in cursor.fetchall()]
+        self.show_plan(details, verbose)
+        problems = []
+        for detail in details:
+            match = POSTGRES_SCAN_RE.search(detail)
+            if match and match.group(1) in self.tables:
+                problems.append((match.group(1), 'scan'))
+            elif detail.strip().lstrip('-> ').startswith('Sort'):
+                problems.append((self.main_table(sql), 'temp-b-tree'))
+        return problems
+
+    def explain_mysql(self, sql, params, verbose):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        self.show_plan(rows, verbose)
+        problems = []
+        for row in rows:
+            if row.get('type') == 'ALL' and row['table'] in self.tables:
+                problems.append((row['table'], 'scan'))
+            extra = row.get('Extra') or ''
+            if 'Using temporary' in extra or 'Using filesort' in extra:
+                problems.append((row['table'], 'temp-b-tree'))
+        return problems
+
+    def show_plan(self, details, verbose):
+        if verbose:
+            for detail in details:
+                self.stdout.write('      %s' % (detail,))
+
+    @staticmethod
+    def main_table(sql):
+        """ 临时排序属于整条查询，记在FROM后的第一个表上 """
+        match = re.search(r'\bFROM\s+"?`?(\w+)', sql, re.IGNORECASE)
+        return match.group(1) if match else '?'
@@ -0,0 +1,87 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from lukeblog.imaging import DERIVATIVE_RE, make_derivatives, process_blob, responsive_images
+from lukeblog.storage import BLOB_DIR
+
+from blog.models import Post
+from blog.pagecache import purge
+from blog.rss import feed_builder
+from blog.sitemap import sitemap_builder
+from blog.watermark import post_watermark
+from config.models import MediaBlob
+
+
+class Command(BaseCommand):
+    help = '为已上传的图片补充生成派生图，并将已有文章正文中的<img>改写为响应式（srcset、懒加载）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-media', action='store_true', help='不生成派生图，只改写文章正文')
+        parser.add_argument('--pending', action='store_true',
+                            help='只重新处理上传超过MEDIA_SETTLE_SECONDS仍未处理完成（如进程重启时丢失了任务）的图片')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            self.process_pending()
+            return
+
+        if not options['skip_media']:
+            count = 0
+            for path in self.upload_files():
+                try:
+                    count += make_derivatives(path)
+                except OSError as e:  # 不是图片或文件已损坏
+                    self.stderr.write('%s：%s' % (path, e))
+            self.stdout.write('已生成%d个派生图' % count)
+
+        changed = []
+        now = timezone.now()
+        for post_id, content_html in Post.objects.values_list('id', 'content_html').iterator():
+            new_html = responsive_images(content_html)
+            if new_html != content_html:
+                # 用update写入，不触发保存文章时的信号（不重新渲染content），由下面统一清除缓存、重新生成；
+                # 输出的HTML变了，修改时间也要更新，否则详情页的ETag/Last-Modified不变，客户端一直得到304
+                Post.objects.filter(pk=post_id).update(content_html=new_html, updated_time=now)
+                changed.append(post_id)
+        if changed:
+            purge(*['post:%s' % post_id for post_id in changed])
+            post_watermark.touch()
+            feed_builder.build_all()
+            sitemap_builder.build_all()  # lastmod是文章的修改时间
+        self.stdout.write(self.style.SUCCESS('已改写%d篇文章' % len(changed)))
+
+    def process_pending(self):
+        """ 后台处理在内存中排队，进程重启会丢失，这里同步补做并记录处理完成 """
+        count = 0
+        for blob in MediaBlob.get_pending(settings.MEDIA_SETTLE_SECONDS).iterator():
+            path = default_storage.path(blob.name)
+            if not os.path.exists(path):
+                continue
+            try:
+                process_blob(path, blob.pk)
+            except OSError as e:  # 文件已损坏
+                self.stderr.write('%s：%s' % (path, e))
+            else:
+                count += 1
+        self.stdout.write(self.style.SUCCESS('已重新处理%d个文件' % count))
+
+    @staticmethod
+    def upload_files():
+        """ 按内容寻址保存的图片和以前富文本编辑器上传目录下的原图（跳过派生图和编辑器生成的缩略图） """
+        for directory in (BLOB_DIR, settings.CKEDITOR_UPLOAD_PATH):
+            yield from Command.image_files(os.path.join(settings.MEDIA_ROOT, directory))
+
+    @staticmethod
+    def image_files(root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                if not (mimetypes.guess_type(filename)[0] or '').startswith('image/'):
+                    continue
+                if DERIVATIVE_RE.search(filename) or os.path.splitext(filename)[0].endswith('_thumb'):
+                    continue
+                yield os.path.join(dirpath, filename)
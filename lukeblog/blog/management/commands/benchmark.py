@@ -0,0 +1,130 @@
+import platform
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from lukeblog import bench
+
+
+class Command(BaseCommand):
+    help = (
+        '在独立的测试数据库中填充数据，测量各页面、API、RSS、站点地图和侧边栏的耗时分位数和查询数；'
+        '与基线（BENCHMARK_BASELINE）比较，查询数超过基线或p95耗时超出容差时失败'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--sidebars', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=30, help='每项测量的次数')
+        parser.add_argument('--warmup', type=int, default=3, help='测量前的预热次数')
+        parser.add_argument('--warm', action='store_true', help='保留缓存（默认每次测量前清空缓存，测量未命中缓存时的耗时）')
+        parser.add_argument('--only', nargs='*', help='只测量这些项')
+        parser.add_argument('--baseline', default=settings.BENCHMARK_BASELINE, help='基线文件（JSON）')
+        parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+        parser.add_argument('--tolerance', type=float, default=settings.BENCHMARK_TOLERANCE,
+                            help='允许p95耗时超出基线的比例')
+        parser.add_argument('--output', help='另外保存本次结果的文件（JSON）')
+
+    def handle(self, *args, **options):
+        before = None if options['warm'] else lambda: cache.clear()  # 清空的是测量期间替换的独立缓存
+        with bench.test_database(), bench.isolated_environment():
+            data = bench.seed(options['posts'], options['categories'], options['tags'], options['comments'],
+                              options['sidebars'])
+            results = {}
+            for name, func in self.cases(data):
+                if options['only'] and name not in options['only']:
+                    continue
+                durations, queries = bench.measure(func, options['iterations'], options['warmup'], before)
+                results[name] = dict(bench.summarize(durations), queries=max(queries))
+                self.stdout.write('%-24s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  查询 %d' % (
+                    name, results[name]['p50'], results[name]['p95'], results[name]['p99'], results[name]['queries']))
+
+        report = {
+            'params': {key: options[key] for key in ('posts', 'categories', 'tags', 'comments', 'sidebars', 'warm')},
+            'python': platform.python_version(),
+            'results': results,
+        }
+        if options['output']:
+            bench.dump_json(options['output'], report)
+        if options['save_baseline']:
+            bench.dump_json(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS('已保存基线：%s' % options['baseline']))
+            return
+
+        baseline = bench.load_json(options['baseline'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING('没有基线文件，可用 --save-baseline 保存本次结果作为基线'))
+            return
+        if baseline['params'] != report['params']:
+            raise CommandError('数据量等参数与基线不同，无法比较：%s' % baseline['params'])
+        regressions = self.compare(baseline['results'], results, options['tolerance'])
+        if regressions:
+            raise CommandError('性能退化：\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('与基线相比没有退化'))
+
+    @staticmethod
+    def compare(baseline, results, tolerance):
+        """ 查询数是硬性预算，不能超过基线；耗时有波动，p95超出基线的tolerance比例（且至少1毫秒）才算退化 """
+        regressions = []
+        for name, result in sorted(results.items()):
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append('%s：查询数 %d -> %d' % (name, base['queries'], result['queries']))
+            limit = max(base['p95'] * (1 + tolerance), base['p95'] + 1)
+            if result['p95'] > limit:
+                regressions.append('%s：p95 %.2fms -> %.2fms' % (name, base['p95'], result['p95']))
+        return regressions
+
+    @staticmethod
+    def cases(data):
+        """ [(名称, 函数), ...]，页面和API以匿名用户请求，返回非200时报错 """
+        from blog.rss import feed_builder
+        from blog.sitemap import sitemap_builder
+        from config.models import SideBar
+
+        client = Client()
+        post_id = data['post_ids'][len(data['post_ids']) // 2]
+        category_id = data['category_ids'][0]
+        tag_id = data['tag_ids'][0]
+
+        def get(url):
+            def func():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError('%s 返回%s' % (url, response.status_code))
+            return func
+
+        def sidebar(display_type):
+            def func():
+                for sidebar in SideBar.objects.filter(display_type=display_type):
+                    sidebar.content_html
+            return func
+
+        return [
+            ('index', get('/')),
+            ('index_page_3', get('/?page=3')),
+            ('category', get('/category/%s/' % category_id)),
+            ('tag', get('/tag/%s/' % tag_id)),
+            ('post_detail', get('/post/%s.html' % post_id)),
+            ('search', get('/search/?keyword=django')),
+            ('comments_page_2', get('/comments/?target=/post/%s.html&page=2' % data['comment_post_id'])),  # 整页评论
+            ('api_post_list', get('/api/post/')),
+            ('api_post_detail', get('/api/post/%s/' % post_id)),
+            ('api_category', get('/api/category/?include=posts')),
+            ('api_suggest', get('/api/suggest/?q=%E6%96%87')),
+            ('rss', get('/rss/')),
+            ('rss_build_main', feed_builder.build_main),
+            ('rss_build_category', lambda: feed_builder.build_category(category_id)),
+            ('sitemap_index', get('/sitemap.xml')),
+            ('sitemap_build_shard', lambda: sitemap_builder.build_shard(0)),
+            ('sidebar_latest', sidebar(SideBar.DISPLAY_LATEST)),
+            ('sidebar_hot', sidebar(SideBar.DISPLAY_HOT)),
+            ('sidebar_comments', sidebar(SideBar.DISPLAY_COMMENT)),
+        ]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.rss import feed_builder
+
+
+class Command(BaseCommand):
+    help = '重新生成全站、所有分类和标签的RSS订阅源（首次部署或修改了SITE_URL、FEED_SIZE后使用）'
+
+    def handle(self, *args, **options):
+        count = feed_builder.build_all()
+        self.stdout.write(self.style.SUCCESS('已生成%d个订阅源：%s' % (count, feed_builder.root)))
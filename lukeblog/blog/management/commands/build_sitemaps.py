@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog.sitemap import sitemap_builder
+
+
+class Command(BaseCommand):
+    help = '重新生成全部站点地图分片和索引（首次部署或修改了SITE_URL、SITEMAP_SHARD_SIZE后使用）'
+
+    def handle(self, *args, **options):
+        count = sitemap_builder.build_all()
+        self.stdout.write(self.style.SUCCESS(
+            '已生成%d个分片，共%d篇文章：%s' % (len(sitemap_builder.shards()), count, sitemap_builder.root)
+        ))
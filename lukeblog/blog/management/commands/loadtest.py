@@ -0,0 +1,426 @@
+import asyncio
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+
+from lukeblog import bench
+
+DEFAULT_MIX = 'list=25,detail=30,visit=20,search=8,api=10,rss=4,comment=3'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')  # SAVEPOINT、BEGIN等事务控制语句不算写入
+
+
+class WriteStats:
+    """
+    安装在压测期间新建的每个数据库连接上（execute_wrapper），统计写语句的耗时（含等待数据库锁的时间）
+    以及“database is locked”等锁错误；各线程共用，用锁保护
+    """
+    def __init__(self):
+        self.queries = 0
+        self.writes = []
+        self.locked = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        is_write = sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if 'locked' in str(e):
+                with self._lock:
+                    self.locked += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.queries += 1
+                if is_write:
+                    self.writes.append(duration)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:  # 每个请求结束后连接关闭，下次重新连接时会再次触发
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        '在独立的测试数据库（SQLite为临时文件，供各线程共享）中填充数据，用线程池（wsgi）或协程（asgi）在进程内并发请求'
+        'lukeblog.wsgi/asgi，按--mix的比例混合列表、详情、访问统计、搜索、API、RSS和评论提交，'
+        '报告吞吐量、各类请求的耗时分位数、错误率以及数据库写语句的耗时和锁错误'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--workers', type=int, default=8, help='并发数')
+        parser.add_argument('--requests', type=int, default=2000, help='请求总数')
+        parser.add_argument('--duration', type=float, help='持续的秒数（指定时忽略--requests）')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='各类请求的权重，默认%s' % DEFAULT_MIX)
+        parser.add_argument('--flush-interval', type=float, default=1.0,
+                            help='压测期间pv/uv写回和评论队列处理的周期（秒），默认比线上短，使较短的压测也有写入')
+        parser.add_argument('--new-visitor-ratio', type=float, default=0.3,
+                            help='不带uid Cookie的请求比例（爬虫、首次访问），它们的访问统计各自占用缓存')
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--sidebars', type=int, default=4)
+        parser.add_argument('--output', help='另外保存本次结果的文件（JSON）')
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        with bench.isolated_environment() as root:
+            name = os.path.join(root, 'loadtest.sqlite3') if connection.vendor == 'sqlite' else None
+            with bench.test_database(name=name):
+                data = bench.seed(options['posts'], options['categories'], options['tags'], options['comments'],
+                                  options['sidebars'])
+                connection.close()  # 之后由各线程各自建立连接
+                report = self.run(data, mix, options)
+        self.show(report)
+        if options['output']:
+            bench.dump_json(options['output'], report)
+
+    @staticmethod
+    def parse_mix(value):
+        kinds = ('list', 'detail', 'visit', 'search', 'api', 'rss', 'comment')
+        mix = {}
+        try:
+            for item in value.split(','):
+                kind, weight = item.split('=')
+                mix[kind.strip()] = float(weight)
+        except ValueError:
+            raise CommandError('--mix格式应为 名称=权重,名称=权重')
+        unknown = set(mix) - set(kinds)
+        if unknown:
+            raise CommandError('未知的请求类型：%s，可用：%s' % (', '.join(sorted(unknown)), ', '.join(kinds)))
+        if not any(mix.values()):
+            raise CommandError('--mix的权重不能全为0')
+        return mix
+
+    def run(self, data, mix, options):
+        """ 并发发送请求，同时由一个线程按COMMENT_QUEUE_INTERVAL处理评论队列（与线上的消费者相同），返回报告 """
+        from comment.queue import comment_queue
+        from blog.counter import visit_counter
+
+        stats = WriteStats()
+        written = Counter()
+        stop = threading.Event()
+
+        def consume():
+            while not stop.wait(comment_queue.interval):
+                try:
+                    accepted, rejected = comment_queue.process()
+                except DatabaseError:
+                    continue  # 评论已放回队列，下次重试
+                written.update(accepted=accepted, rejected=rejected)
+            connections.close_all()
+
+        budget = Budget(options['requests'], options['duration'])
+        traffic = Traffic(data, mix, options['new_visitor_ratio'])
+        intervals = visit_counter.flush_interval, comment_queue.interval
+        visit_counter.flush_interval = comment_queue.interval = options['flush_interval']
+        connection_created.connect(stats.install)
+        try:
+            consumer = threading.Thread(target=consume, daemon=True)
+            consumer.start()
+            start = time.perf_counter()
+            try:
+                if options['mode'] == 'wsgi':
+                    results = self.run_wsgi(traffic, budget, options['workers'])
+                else:
+                    results = asyncio.run(self.run_asgi(traffic, budget, options['workers']))
+                elapsed = time.perf_counter() - start
+            finally:
+                stop.set()
+                consumer.join()
+
+            # 压测结束后剩余的评论和访问计数：不计入请求耗时，但计入数据库写入的统计
+            connection.ensure_connection()
+            if stats not in connection.execute_wrappers:
+                connection.execute_wrappers.append(stats)
+            accepted, rejected = comment_queue.process()
+            written.update(accepted=accepted, rejected=rejected)
+            visit_counter.flush()
+        finally:
+            connection_created.disconnect(stats.install)
+            if stats in connection.execute_wrappers:
+                connection.execute_wrappers.remove(stats)
+            visit_counter.flush_interval, comment_queue.interval = intervals
+        return self.build_report(results, elapsed, stats, written, options)
+
+    @staticmethod
+    def run_wsgi(traffic, budget, workers):
+        from lukeblog.wsgi import application
+
+        results = []
+
+        def work(seed_value):
+            rng = random.Random(seed_value)
+            visitor = traffic.new_visitor()
+            local = []
+            try:
+                while budget.take():
+                    request = traffic.next(rng, visitor)
+                    start = time.perf_counter()
+                    try:
+                        status = call_wsgi(application, request)
+                    except Exception:
+                        status = 0  # 异常没有被Django转换为500响应
+                    local.append((request['kind'], status, time.perf_counter() - start))
+            finally:
+                results.extend(local)
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @staticmethod
+    async def run_asgi(traffic, budget, workers):
+        """ Django 3.0的ASGIHandler在线程中运行同步的视图和中间件，这里测量的是这种方式下的并发表现 """
+        from lukeblog.asgi import application
+
+        results = []
+
+        async def work(seed_value):
+            rng = random.Random(seed_value)
+            visitor = traffic.new_visitor()
+            while budget.take():
+                request = traffic.next(rng, visitor)
+                start = time.perf_counter()
+                try:
+                    status = await call_asgi(application, request)
+                except Exception:
+                    status = 0
+                results.append((request['kind'], status, time.perf_counter() - start))
+
+        await asyncio.gather(*(work(i) for i in range(workers)))
+        return results
+
+    @staticmethod
+    def build_report(results, elapsed, stats, written, options):
+        by_kind = defaultdict(list)
+        for kind, status, duration in results:
+            by_kind[kind].append((status, duration))
+
+        def is_error(status):
+            return status == 0 or (status >= 400 and status != 429)  # 429为评论频率限制，单独统计
+
+        kinds = {}
+        for kind, items in sorted(by_kind.items()):
+            errors = sum(1 for status, duration in items if is_error(status))
+            kinds[kind] = dict(bench.summarize([duration for status, duration in items]),
+                               errors=errors, limited=sum(1 for status, duration in items if status == 429))
+        errors = sum(1 for kind, status, duration in results if is_error(status))
+        return {
+            'params': {key: options[key] for key in (
+                'mode', 'workers', 'requests', 'duration', 'mix', 'flush_interval', 'new_visitor_ratio',
+                'posts', 'categories', 'tags', 'comments', 'sidebars')},
+            'requests': len(results),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(len(results) / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(errors / len(results), 4) if results else 0.0,
+            'status': {str(status): count for status, count in sorted(Counter(
+                status for kind, status, duration in results).items())},
+            'latency': bench.summarize([duration for kind, status, duration in results]),
+            'kinds': kinds,
+            'database': {
+                'queries': stats.queries,
+                'writes': dict(bench.summarize(stats.writes), total=round(sum(stats.writes), 3)),
+                'locked_errors': stats.locked,
+            },
+            'comments': {'accepted': written['accepted'], 'rejected': written['rejected']},
+        }
+
+    def show(self, report):
+        params = report['params']
+        self.stdout.write('%s模式，%d个并发，%d个请求，耗时%.2f秒，吞吐量%.1f请求/秒' % (
+            params['mode'], params['workers'], report['requests'], report['elapsed'], report['throughput']))
+        self.stdout.write('错误率%.2f%%，状态码：%s' % (report['error_rate'] * 100, json.dumps(report['status'])))
+        latency = report['latency']
+        self.stdout.write('%-8s %6d  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms' % (
+            '全部', report['requests'], latency['p50'], latency['p95'], latency['p99']))
+        for kind, result in report['kinds'].items():
+            line = '%-8s %6d  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  错误 %d' % (
+                kind, result['count'], result['p50'], result['p95'], result['p99'], result['errors'])
+            if result['limited']:
+                line += '  限流 %d' % result['limited']
+            self.stdout.write(line)
+        database = report['database']
+        writes = database['writes']
+        self.stdout.write('数据库：%d条查询，其中写语句%d条，共%.3f秒（含等待锁），p95 %.2fms，最长 %.2fms，锁错误%d次' % (
+            database['queries'], writes['count'], writes['total'], writes['p95'], writes['max'],
+            database['locked_errors']))
+        self.stdout.write('评论：写入%d条，丢弃%d条' % (report['comments']['accepted'], report['comments']['rejected']))
+        style = self.style.ERROR if report['error_rate'] or database['locked_errors'] else self.style.SUCCESS
+        self.stdout.write(style('完成'))
+
+
+class Budget:
+    """ 各worker共享的请求配额：限定请求总数，或限定持续时间 """
+    def __init__(self, requests, duration=None):
+        self.remaining = requests
+        self.deadline = time.perf_counter() + duration if duration else None
+        self._lock = threading.Lock()
+
+    def take(self):
+        if self.deadline is not None:
+            return time.perf_counter() < self.deadline
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class Traffic:
+    """
+    按权重生成请求。文章的访问集中在少数热门文章上；每个worker是一个带uid Cookie的访客，
+    但有new_visitor_ratio比例的请求不带Cookie（每次得到新的uid）。
+    评论提交每条来自不同的访客（随机IP、新uid），否则很快会被频率限制挡住，测不到写入
+    """
+    def __init__(self, data, mix, new_visitor_ratio):
+        self.post_ids = data['post_ids']
+        self.category_ids = data['category_ids']
+        self.tag_ids = data['tag_ids']
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.new_visitor_ratio = new_visitor_ratio
+
+    @staticmethod
+    def new_visitor():
+        return {'uid': uuid.uuid4().hex, 'ip': '10.0.%d.%d' % (random.randint(0, 255), random.randint(1, 254))}
+
+    def next(self, rng, visitor):
+        kind = rng.choices(self.kinds, self.weights)[0]
+        request = {'kind': kind, 'method': 'GET', 'query': '', 'body': b'', 'content_type': '',
+                   'ip': visitor['ip'], 'cookies': {}}
+        if rng.random() >= self.new_visitor_ratio:
+            request['cookies']['uid'] = visitor['uid']
+        getattr(self, kind)(rng, request)
+        return request
+
+    def post_id(self, rng):
+        return self.post_ids[int(len(self.post_ids) * rng.random() ** 3)]  # 越靠前的文章越热门
+
+    def list(self, rng, request):
+        request['path'], request['query'] = rng.choice([
+            ('/', ''),
+            ('/', 'page=%d' % rng.randint(2, 5)),
+            ('/category/%s/' % rng.choice(self.category_ids), ''),
+            ('/tag/%s/' % rng.choice(self.tag_ids), ''),
+        ])
+
+    def detail(self, rng, request):
+        post_id = self.post_id(rng)
+        if rng.random() < 0.2:
+            request['path'] = '/comments/'
+            request['query'] = urlencode({'target': '/post/%s.html' % post_id, 'page': 2})
+        else:
+            request['path'] = '/post/%s.html' % post_id
+
+    def visit(self, rng, request):
+        """ 详情页加载后由navigator.sendBeacon上报的访问统计，会更新pv/uv缓冲和缓存中的计数 """
+        request.update(method='POST', path='/beacon/', content_type='application/json',
+                       body=json.dumps({'events': [{'post_id': self.post_id(rng)}]}).encode())
+
+    def search(self, rng, request):
+        request['path'] = '/search/'
+        request['query'] = urlencode({'keyword': rng.choice(bench.WORDS)})
+
+    def api(self, rng, request):
+        request['path'], request['query'] = rng.choice([
+            ('/api/post/', ''),
+            ('/api/post/%s/' % self.post_id(rng), ''),
+            ('/api/category/', ''),
+            ('/api/suggest/', urlencode({'q': rng.choice(bench.WORDS)[:2]})),
+        ])
+
+    def rss(self, rng, request):
+        request['path'] = rng.choice(['/rss/', '/rss/category/%s/' % rng.choice(self.category_ids)])
+
+    def comment(self, rng, request):
+        csrf_request = HttpRequest()
+        token = get_token(csrf_request)
+        post_id = self.post_id(rng)
+        request.update(
+            method='POST', path='/comment/', content_type='application/x-www-form-urlencoded',
+            ip='172.16.%d.%d' % (rng.randint(0, 255), rng.randint(1, 254)),
+            cookies={'csrftoken': csrf_request.META['CSRF_COOKIE']},
+            body=urlencode({
+                'csrfmiddlewaretoken': token, 'target': '/post/%s.html' % post_id, 'nickname': '压测',
+                'email': 'load@example.com', 'website': 'https://example.com',
+                'content': '压测评论 %s %s' % (uuid.uuid4().hex[:8], rng.choice(bench.WORDS)),
+            }).encode(),
+        )
+
+
+def call_wsgi(application, request):
+    """ 以WSGI方式调用application，读完响应体，返回状态码 """
+    environ = {
+        'REQUEST_METHOD': request['method'],
+        'PATH_INFO': request['path'],
+        'QUERY_STRING': request['query'],
+        'REMOTE_ADDR': request['ip'],
+        'CONTENT_TYPE': request['content_type'],
+        'CONTENT_LENGTH': str(len(request['body'])),
+        'wsgi.input': io.BytesIO(request['body']),
+    }
+    if request['cookies']:
+        environ['HTTP_COOKIE'] = '; '.join('%s=%s' % item for item in request['cookies'].items())
+    setup_testing_defaults(environ)
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(int(value.split(' ', 1)[0]))
+
+    response = application(environ, start_response)
+    try:
+        for chunk in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()  # 触发request_finished，关闭本次请求的数据库连接
+    return status[0]
+
+
+async def call_asgi(application, request):
+    """ 以ASGI方式调用application，返回状态码 """
+    headers = [(b'host', b'testserver'), (b'content-length', str(len(request['body'])).encode())]
+    if request['content_type']:
+        headers.append((b'content-type', request['content_type'].encode()))
+    if request['cookies']:
+        headers.append((b'cookie', '; '.join('%s=%s' % item for item in request['cookies'].items()).encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': request['method'], 'path': request['path'], 'raw_path': request['path'].encode(),
+        'query_string': request['query'].encode(), 'root_path': '', 'headers': headers,
+        'client': (request['ip'], 50000), 'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': request['body'], 'more_body': False}]
+    status = []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.search import search_index
+
+
+class Command(BaseCommand):
+    help = '从数据库重建站内搜索的倒排索引（冷启动或索引文件损坏时使用）'
+
+    def handle(self, *args, **options):
+        count = search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS('已索引%d篇文章：%s' % (count, search_index.path)))
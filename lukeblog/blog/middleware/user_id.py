@@ -1,11 +1,17 @@
 import uuid
 
+from django.conf import settings
+
 
 USER_KEY = 'uid'
 TEN_YEARS = 60 * 60 * 24 * 365 * 10
 
 
 class UserIDMiddleware:
+    """
+    在request中增加uid。只有Cookie中还没有uid、并且路径在UID_COOKIE_PATHS中时才下发Cookie，
+    其余响应不带Set-Cookie，可以被反向代理等共享缓存缓存。
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -13,7 +19,8 @@ class UserIDMiddleware:
         uid = self.generate_uid(request)
         request.uid = uid
         response = self.get_response(request)
-        response.set_cookie(USER_KEY, uid, max_age=TEN_YEARS, httponly=True)
+        if USER_KEY not in request.COOKIES and self.needs_cookie(request.path):
+            response.set_cookie(USER_KEY, uid, max_age=TEN_YEARS, httponly=True)
         return response
 
     def generate_uid(self, request):
@@ -22,3 +29,6 @@ class UserIDMiddleware:
         except KeyError:
             uid = uuid.uuid4().hex
         return uid
+
+    def needs_cookie(self, path):
+        return any(path.startswith(prefix) for prefix in settings.UID_COOKIE_PATHS)
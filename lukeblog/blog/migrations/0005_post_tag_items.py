@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def fill_tag_items(apps, schema_editor):
+    """ 为已有文章生成标签冗余字段 """
+    import json
+
+    Post = apps.get_model('blog', 'Post')
+    items = {}
+    for post_id, tag_id, name in Post.tag.through.objects.order_by('tag_id').values_list('post_id', 'tag_id', 'tag__name'):
+        items.setdefault(post_id, []).append([tag_id, name])
+    for post_id, tag_items in items.items():
+        Post.objects.filter(pk=post_id).update(tag_items=json.dumps(tag_items, ensure_ascii=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_is_md'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='tag_items',
+            field=models.TextField(default='[]', editable=False, verbose_name='标签缓存'),
+        ),
+        migrations.RunPython(fill_tag_items, migrations.RunPython.noop),
+    ]
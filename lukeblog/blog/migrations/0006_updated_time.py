@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_updated_time(apps, schema_editor):
+    """ 已有数据的修改时间取创建时间 """
+    from django.db.models import F
+
+    for model_name in ('Category', 'Tag', 'Post'):
+        apps.get_model('blog', model_name).objects.update(updated_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_tag_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='修改时间'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='修改时间'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='修改时间'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_time, migrations.RunPython.noop),
+    ]
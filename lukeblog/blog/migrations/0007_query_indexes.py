@@ -0,0 +1,37 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_updated_time'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['status'], name='category_status'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'id'], name='post_status_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'category', 'id'], name='post_status_category_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'owner', 'id'], name='post_status_owner_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'pv'], name='post_status_pv'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['status'], name='tag_status'),
+        ),
+    ]
@@ -1,9 +1,13 @@
+import json
+
 import mistune  # 将Markdown转换为Html的第三方库
 
+from django.utils import timezone
 from django.utils.functional import cached_property  # 将方法返回的值缓存成实例的属性（装饰器）
 from django.contrib.auth.models import User
 from django.db import models
-from django.core.cache import cache  # 热门文章缓存
+
+from lukeblog.imaging import responsive_images
 
 
 class Category(models.Model):
@@ -19,6 +23,7 @@ class Category(models.Model):
     is_nav = models.BooleanField(default=False, verbose_name="是否为导航")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="作者")
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="修改时间")
 
     @classmethod
     def get_navs(cls):
@@ -42,6 +47,9 @@ class Category(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = '分类'
+        indexes = [
+            models.Index(fields=['status'], name='category_status'),  # 导航、分类API
+        ]
 
 
 class Tag(models.Model):
@@ -56,12 +64,16 @@ class Tag(models.Model):
     status = models.PositiveIntegerField(default=STATUS_NORMAL, choices=STATUS_ITEMS, verbose_name="状态")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="作者")
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="修改时间")
 
     def __str__(self):
         return self.name
 
     class Meta:
         verbose_name = verbose_name_plural = '标签'
+        indexes = [
+            models.Index(fields=['status'], name='tag_status'),  # 订阅源、搜索建议
+        ]
 
 
 class Post(models.Model):
@@ -83,13 +95,47 @@ class Post(models.Model):
     tag = models.ManyToManyField(Tag, verbose_name="标签")
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="作者")
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="修改时间")
     is_md = models.BooleanField(default=False, verbose_name="使用MarkDown语法")
     pv = models.PositiveIntegerField(default=1)
     uv = models.PositiveIntegerField(default=1)
+    # 标签的冗余副本（JSON格式的[[id, 名称], ...]），由signals.py在标签变化时同步，列表页、RSS、API读取它而不必逐篇查询标签，
+    # 标签数据仍以tag字段为准
+    tag_items = models.TextField(default='[]', editable=False, verbose_name="标签缓存")
+
+    @property
+    def live_pv(self):
+        """ 数据库中的pv加上尚未写回的增量 """
+        from .counter import visit_counter
+        return self.pv + visit_counter.get_delta(self.id)[0]
+
+    @property
+    def live_uv(self):
+        """ 数据库中的uv加上尚未写回的增量 """
+        from .counter import visit_counter
+        return self.uv + visit_counter.get_delta(self.id)[1]
 
     @cached_property  # 将方法返回的值缓存成实例的属性
+    def tag_list(self):
+        """ 从冗余字段读取标签，返回[{'id': 1, 'name': '名称'}, ...]，不查询数据库 """
+        return [{'id': tag_id, 'name': name} for tag_id, name in json.loads(self.tag_items)]
+
+    @cached_property
     def tags(self):
-        return ','.join(self.tag.values_list('name', flat=True))
+        return ','.join(tag['name'] for tag in self.tag_list)
+
+    @classmethod
+    def sync_tag_items(cls, post_ids):
+        """ 根据tag字段重新生成这些文章的标签冗余字段（标签变化也算作文章的修改，同时更新updated_time） """
+        items = {post_id: [] for post_id in post_ids}
+        rows = cls.tag.through.objects.filter(post_id__in=items).order_by('tag_id')
+        for post_id, tag_id, name in rows.values_list('post_id', 'tag_id', 'tag__name'):
+            items[post_id].append([tag_id, name])
+        now = timezone.now()
+        for post_id, tag_items in items.items():
+            cls.objects.filter(pk=post_id).update(
+                tag_items=json.dumps(tag_items, ensure_ascii=False), updated_time=now,
+            )
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
@@ -99,7 +145,12 @@ class Post(models.Model):
             self.content_html = mistune.markdown(self.content)  # 转换Markdown格式并替换content_html的内容
         else:
             self.content_html = self.content  # 如果不是选用MarkDown，则使用富文本编辑器直接转换为HTML，所以这里不作转换
-        super().save()
+        self.content_html = responsive_images(self.content_html)  # 上传的图片改为响应式（srcset、懒加载）
+        if not self._state.adding and update_fields is None:
+            # 更新已有文章时不写回pv/uv（由计数器用F表达式累加）和标签冗余字段（由信号同步），以免用实例中过期的值覆盖
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in ('pv', 'uv', 'tag_items')]
+        super().save(force_insert, force_update, using, update_fields)
 
     @staticmethod
     def get_by_tag(tag_id):
@@ -138,12 +189,9 @@ class Post(models.Model):
 
     @classmethod
     def hot_posts(cls):
-        """ 根据pv排序热门文章 """
-        result = cache.get('hot_posts')  # 尝试从缓存读取热门文章数据
-        if not result:
-            result = cls.objects.filter(status=cls.STATUS_NORMAL).order_by('-pv')
-            cache.set('hot_posts', result, 10 * 60)  # 将数据存入缓存
-        return result
+        """ 热门文章Top-N列表（由blog/ranking.py增量维护），每一项为包含id、title、pv、uv的字典 """
+        from .ranking import hot_ranking
+        return hot_ranking.get()
 
     def __str__(self):
         return self.title
@@ -151,3 +199,10 @@ class Post(models.Model):
     class Meta:
         verbose_name = verbose_name_plural = '文章'
         ordering = ['-id']  # 根据id进行降序排列
+        # 按常用查询设计的索引（可用 python manage.py audit_query_plans 检查执行计划）
+        indexes = [
+            models.Index(fields=['status', 'id'], name='post_status_id'),  # 首页、API、站点地图、订阅源
+            models.Index(fields=['status', 'category', 'id'], name='post_status_category_id'),  # 分类页、分类API
+            models.Index(fields=['status', 'owner', 'id'], name='post_status_owner_id'),  # 作者页
+            models.Index(fields=['status', 'pv'], name='post_status_pv'),  # 热门文章
+        ]
@@ -0,0 +1,89 @@
+""" 匿名访问的整页缓存：每个页面记录它依赖的数据（surrogate key），数据变化时只清除受影响的页面 """
+import hashlib
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .chrome import chrome
+
+PAGE_KEY = 'page:%s'
+TAG_KEY = 'page_tags:%s'
+CSRF_PLACEHOLDER = '__CSRF_TOKEN_PLACEHOLDER__'
+CSRF_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+MAX_PARAM_LENGTH = 50
+
+
+def normalize_query(query_dict, params):
+    """ 只保留视图实际使用的查询参数（按固定顺序、忽略空值），避免无关参数使同一页面产生大量缓存；参数值过长时返回None，不缓存 """
+    items = []
+    for name in params:
+        value = query_dict.get(name)
+        if not value:
+            continue
+        if len(value) > MAX_PARAM_LENGTH:
+            return None
+        items.append((name, value))
+    return urlencode(items)
+
+
+def purge(*tags):
+    """ 清除带有任一标签的页面缓存 """
+    keys = []
+    for tag in tags:
+        keys.extend(cache.get(TAG_KEY % tag) or ())
+    cache.delete_many(keys + [TAG_KEY % tag for tag in tags])
+
+
+def add_tags(page_key, tags):
+    """ 在每个标签下记录页面的缓存键（读-改-写，并发时可能丢失少量记录，由页面缓存的过期时间兜底） """
+    for tag in tags:
+        tag_key = TAG_KEY % tag
+        keys = cache.get(tag_key) or set()
+        keys.add(page_key)
+        cache.set(tag_key, keys, settings.PAGE_CACHE_TIMEOUT)
+
+
+class PageCacheMixin:
+    """
+    用于列表页和详情页：匿名用户的GET请求命中缓存时直接返回页面，不再查询、渲染。
+    缓存键由路径、规范化后的查询参数和站点公共部分（导航、侧边栏）的摘要组成；
+    子类通过get_page_cache_tags()返回页面依赖的数据标签，数据变化时由signals.py调用purge()清除。
+    """
+    page_cache_params = ('page', 'after', 'before', 'keyword')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        page_key = self.get_page_cache_key()
+        if page_key is None:
+            return super().dispatch(request, *args, **kwargs)
+        cached = cache.get(page_key)
+        if cached is not None:
+            content, content_type = cached
+            # 页面中的CSRF token是按用户生成的，命中缓存时替换为当前用户的token
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and hasattr(response, 'render'):
+            response.render()
+            content = CSRF_RE.sub(r'\1%s\2' % CSRF_PLACEHOLDER, response.content.decode(response.charset))
+            cache.set(page_key, (content, response['Content-Type']), settings.PAGE_CACHE_TIMEOUT)
+            add_tags(page_key, self.get_page_cache_tags(response.context_data))
+        return response
+
+    def get_page_cache_key(self):
+        query = normalize_query(self.request.GET, self.page_cache_params)
+        if query is None:
+            return None
+        raw = '%s?%s#%s' % (self.request.path, query, chrome.digest())
+        return PAGE_KEY % hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def get_page_cache_tags(self, context):
+        """ 返回页面依赖的数据标签，如['post:1', 'category:2'] """
+        return []
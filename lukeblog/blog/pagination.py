@@ -0,0 +1,121 @@
+""" 基于id的游标（keyset）分页：翻页代价与页码无关，也不需要COUNT(*) """
+from django.conf import settings
+from django.http import Http404
+from rest_framework import pagination
+
+
+class KeysetPage:
+    """ 与Django的Page对象用法类似的一页数据，翻页链接由查询字符串给出（?page=N 或 ?after=id / ?before=id） """
+    def __init__(self, object_list, number, has_next, has_previous, next_query, previous_query):
+        self.object_list = object_list
+        self.number = number  # 游标翻页时为None
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """
+    用于按Post.Meta.ordering（-id）排序的列表视图：
+    前KEYSET_PAGE_LIMIT页仍支持 ?page=N（兼容旧链接，但不再COUNT），之后的翻页链接改为 ?after=<本页最后一篇的id>，
+    向前翻页为 ?before=<本页第一篇的id>，超过KEYSET_PAGE_LIMIT的页码返回404，避免爬虫遍历深页码。
+    """
+    def paginate_queryset(self, queryset, page_size):
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        try:
+            if after:
+                page = self.keyset_page(queryset, page_size, after=int(after))
+            elif before:
+                page = self.keyset_page(queryset, page_size, before=int(before))
+            else:
+                page = self.offset_page(queryset, page_size, int(self.request.GET.get('page') or 1))
+        except ValueError:
+            raise Http404('无效的页码')
+        return None, page, page.object_list, page.has_other_pages()
+
+    def offset_page(self, queryset, page_size, number):
+        if not 1 <= number <= settings.KEYSET_PAGE_LIMIT:
+            raise Http404('页码超出范围')
+        start = (number - 1) * page_size
+        rows = list(queryset[start:start + page_size + 1])  # 多取一条判断是否有下一页
+        if not rows and number > 1:
+            raise Http404('没有更多文章了')
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if number < settings.KEYSET_PAGE_LIMIT:
+            next_query = self.page_query(page=number + 1)
+        else:
+            next_query = self.page_query(after=rows[-1].id) if rows else ''
+        previous_query = self.page_query(page=number - 1) if number > 1 else ''
+        return KeysetPage(rows, number, has_next, number > 1, next_query, previous_query)
+
+    def keyset_page(self, queryset, page_size, after=None, before=None):
+        if after is not None:
+            rows = list(queryset.filter(id__lt=after)[:page_size + 1])
+            has_next, has_previous = len(rows) > page_size, True
+            rows = rows[:page_size]
+        else:
+            rows = list(queryset.filter(id__gt=before).order_by('id')[:page_size + 1])
+            has_next, has_previous = True, len(rows) > page_size
+            rows = rows[:page_size][::-1]
+        if not rows:
+            raise Http404('没有更多文章了')
+        return KeysetPage(
+            rows, None, has_next, has_previous,
+            self.page_query(after=rows[-1].id), self.page_query(before=rows[0].id),
+        )
+
+    def page_query(self, **params):
+        """ 生成翻页链接的查询字符串，保留keyword等其他参数 """
+        query = self.request.GET.copy()
+        for name in ('page', 'after', 'before'):
+            query.pop(name, None)
+        query.update(params)
+        return query.urlencode()
+
+
+class PostCursorPagination(pagination.CursorPagination):
+    """
+    文章API的游标分页（?cursor=...&limit=N），不做COUNT(*)，翻页代价与深度无关；
+    请求中带有offset参数时按原来的LimitOffsetPagination处理，兼容旧的翻页链接
+    """
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def __init__(self):
+        self.legacy = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if pagination.LimitOffsetPagination.offset_query_param in request.query_params:
+            self.legacy = pagination.LimitOffsetPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.legacy:
+            return self.legacy.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        return self.legacy.get_next_link() if self.legacy else super().get_next_link()
+
+    def get_previous_link(self):
+        return self.legacy.get_previous_link() if self.legacy else super().get_previous_link()
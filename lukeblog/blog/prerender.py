@@ -0,0 +1,68 @@
+""" 预生成的静态文件（站点地图、RSS）：原子写入磁盘（可同时写一份gzip压缩版），由视图直接读取文件返回，支持条件GET """
+import datetime
+import gzip
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+
+from .conditional import conditional_response
+
+
+def get_site_url():
+    """ 预生成文件不经过请求，其中的链接用SITE_URL拼接；未设置时报错，而不是生成指向错误域名的文件 """
+    if not settings.SITE_URL:
+        raise ImproperlyConfigured('没有设置SITE_URL（站点的完整地址，如https://www.example.com），无法生成站点地图和RSS')
+    return settings.SITE_URL.rstrip('/')
+
+
+def write_file(path, content, compress=False):
+    """ 先写临时文件再替换，读取方不会读到写了一半的文件；compress为True时再写一份path.gz """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _replace(path, content)
+    if compress:
+        _replace(path + '.gz', gzip.compress(content, mtime=0))  # mtime=0使内容相同时压缩结果也相同
+    elif os.path.exists(path + '.gz'):
+        os.remove(path + '.gz')
+
+
+def remove_file(path):
+    for name in (path, path + '.gz'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def serve_file(request, path, content_type):
+    """ 返回预生成文件的内容，客户端接受gzip且有压缩版时返回压缩版；文件不存在时返回404 """
+    use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '') and os.path.exists(path + '.gz')
+    file_path = path + '.gz' if use_gzip else path
+
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        raise Http404('文件尚未生成')
+
+    def get_validators():
+        """ 校验值只需stat，不读文件内容 """
+        etag = '%x-%x%s' % (stat.st_mtime_ns, stat.st_size, '-gz' if use_gzip else '')
+        return etag, datetime.datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+    def get_response():
+        with open(file_path, 'rb') as f:
+            response = HttpResponse(f.read(), content_type=content_type)
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    return conditional_response(request, get_validators, get_response)
+
+
+def _replace(path, content):
+    temp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
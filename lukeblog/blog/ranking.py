@@ -0,0 +1,98 @@
+""" 热门文章排行：在缓存中维护一个有界的Top-N列表，随访问计数写回和文章状态变化增量更新，不再对全表排序 """
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Post
+
+RANKING_KEY = 'hot_posts'
+
+
+class HotRanking:
+    """
+    列表中每一项为{'id', 'title', 'pv', 'uv', 'created'}，得分 = (pv + uv_weight * uv) / (发布小时数 + 2) ** gravity，
+    gravity为0时不做时间衰减，即与原来一样按pv排序。
+    注：开启时间衰减后，列表之外的文章只有在被访问或修改时才会重新参与排名，因此列表每隔timeout秒会从数据库重建一次。
+    """
+    def __init__(self, size, uv_weight, gravity, timeout):
+        self.size = size
+        self.uv_weight = uv_weight
+        self.gravity = gravity
+        self.timeout = timeout
+
+    def score(self, entry, now=None):
+        base = entry['pv'] + self.uv_weight * entry['uv']
+        if not self.gravity:
+            return base
+        hours = ((now or time.time()) - entry['created']) / 3600
+        return base / (max(hours, 0) + 2) ** self.gravity
+
+    def get(self):
+        """ 返回当前的热门文章列表（叠加尚未写回数据库的pv/uv增量），耗时只与N有关 """
+        from .counter import visit_counter  # 避免循环引用
+
+        entries = cache.get(RANKING_KEY)
+        if entries is None:
+            entries = self.rebuild()
+        result = []
+        for entry in entries:
+            pv, uv = visit_counter.get_delta(entry['id'])
+            result.append(dict(entry, pv=entry['pv'] + pv, uv=entry['uv'] + uv))
+        return self._sorted(result)
+
+    def rebuild(self):
+        """ 冷启动时从数据库取出候选文章（pv最高的和最新的）建立列表 """
+        queryset = Post.objects.filter(status=Post.STATUS_NORMAL).values('id', 'title', 'pv', 'uv', 'created_time')
+        rows = list(queryset.order_by('-pv')[:self.size * 2])
+        if self.gravity:
+            rows += list(queryset.order_by('-id')[:self.size])
+        entries = self._sorted({entry['id']: entry for entry in map(self._to_entry, rows)}.values())[:self.size]
+        cache.set(RANKING_KEY, entries, self.timeout)
+        return entries
+
+    def update(self, rows):
+        """ 用最新的文章数据（values()的结果）增量更新列表：已在列表中的更新分数，不在列表中的与末位比较后决定是否进入 """
+        entries = cache.get(RANKING_KEY)
+        if entries is None:
+            self.rebuild()
+            return
+        changed = {row['id']: row for row in rows}
+        kept = [entry for entry in entries if entry['id'] not in changed]
+        added = [self._to_entry(row) for row in changed.values() if row['status'] == Post.STATUS_NORMAL]
+        if len(kept) + len(added) < min(len(entries), self.size):
+            # 有文章被删除或转为草稿而离开列表，此时无法得知下一名是谁，直接重建
+            self.rebuild()
+            return
+        cache.set(RANKING_KEY, self._sorted(kept + added)[:self.size], self.timeout)
+
+    def update_posts(self, post_ids):
+        """ 访问计数写回数据库后，按文章id取出最新的pv/uv更新列表 """
+        rows = Post.objects.filter(pk__in=post_ids).values('id', 'title', 'status', 'pv', 'uv', 'created_time')
+        self.update(list(rows))
+
+    def update_post(self, post):
+        """ 文章保存（包括状态变化）后更新列表；实例中的pv/uv可能早已过期（保存时也不写回），从数据库重新读取 """
+        self.update_posts([post.id])
+
+    def remove(self, post_id):
+        """ 文章被删除后，如果它在列表中则重建列表 """
+        entries = cache.get(RANKING_KEY)
+        if entries is not None and any(entry['id'] == post_id for entry in entries):
+            self.rebuild()
+
+    def _sorted(self, entries):
+        now = time.time()
+        return sorted(entries, key=lambda entry: self.score(entry, now), reverse=True)
+
+    @staticmethod
+    def _to_entry(row):
+        return {
+            'id': row['id'], 'title': row['title'], 'pv': row['pv'], 'uv': row['uv'],
+            'created': row['created_time'].timestamp(),
+        }
+
+
+hot_ranking = HotRanking(
+    settings.HOT_POSTS_SIZE, settings.HOT_POSTS_UV_WEIGHT, settings.HOT_POSTS_GRAVITY, settings.HOT_POSTS_TIMEOUT,
+)
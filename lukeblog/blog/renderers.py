@@ -0,0 +1,17 @@
+""" API的JSON渲染器：安装了orjson时用它编码，速度比标准库json快数倍；未安装时与DRF默认的JSONRenderer相同 """
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson是可选依赖
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ 输出与JSONRenderer一致（UTF-8、紧凑格式）；Accept头中要求缩进（indent）时仍交给JSONRenderer """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.encoder_class().default)
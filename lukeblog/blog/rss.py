@@ -1,9 +1,12 @@
-from django.contrib.syndication.views import Feed
+""" 预生成的RSS订阅源：全站（最新文章）、每个分类、每个标签各一个文件，文章发布或修改时重新生成，视图直接返回文件 """
+import os
+
+from django.conf import settings
 from django.urls import reverse
 from django.utils.feedgenerator import Rss201rev2Feed
 
-
-from .models import Post
+from .models import Category, Tag, Post
+from .prerender import get_site_url, write_file, remove_file
 
 
 class ExtendedRSSFeed(Rss201rev2Feed):
@@ -12,26 +15,103 @@ class ExtendedRSSFeed(Rss201rev2Feed):
         handler.addQuickElement('content:html', item['content_html'])
 
 
-class LatestPostFeed(Feed):
-    feed_type = ExtendedRSSFeed
+class FeedBuilder:
+    """
+    订阅源文件为 <root>/main.xml、<root>/category-<id>.xml、<root>/tag-<id>.xml（可同时有.gz压缩版），
+    每个文件包含最新的size篇文章，生成时不经过请求，链接用SITE_URL拼接
+    """
     title = "Luke Blog System"
-    link = "/rss/"
     description = "This is a blog system powered by Luke."
 
-    def items(self):
-        return Post.objects.filter(status=Post.STATUS_NORMAL)[:5]
+    def __init__(self, root, size, compress):
+        self.root = root
+        self.size = size
+        self.compress = compress
+
+    @property
+    def site_url(self):
+        return get_site_url()
+
+    def path(self, kind, obj_id=None):
+        """ kind为'main'、'category'或'tag' """
+        name = 'main.xml' if kind == 'main' else '%s-%s.xml' % (kind, obj_id)
+        return os.path.join(self.root, name)
+
+    def update(self, category_ids=(), tag_ids=()):
+        """ 文章变化后重新生成全站以及相关分类、标签的订阅源 """
+        self.build_main()
+        for category_id in set(category_ids):
+            self.build_category(category_id)
+        for tag_id in set(tag_ids):
+            self.build_tag(tag_id)
+
+    def build(self, kind, obj_id=None):
+        """ 生成一个订阅源，返回是否生成了文件 """
+        return self.build_main() if kind == 'main' else getattr(self, 'build_%s' % kind)(obj_id)
+
+    def build_main(self):
+        self._write(self.path('main'), self.title, reverse('index'), reverse('rss'), Post.objects.all())
+        return True
+
+    def build_category(self, category_id):
+        """ 分类不存在或已删除时删除它的订阅源文件，返回是否生成了文件 """
+        category = Category.objects.filter(pk=category_id, status=Category.STATUS_NORMAL).first()
+        if category is None:
+            remove_file(self.path('category', category_id))
+            return False
+        self._write(
+            self.path('category', category_id), '%s - %s' % (self.title, category.name),
+            reverse('category-list', args=[category_id]), reverse('rss-category', args=[category_id]),
+            Post.objects.filter(category_id=category_id),
+        )
+        return True
 
-    def item_title(self, item):
-        return item.title
+    def build_tag(self, tag_id):
+        tag = Tag.objects.filter(pk=tag_id, status=Tag.STATUS_NORMAL).first()
+        if tag is None:
+            remove_file(self.path('tag', tag_id))
+            return False
+        self._write(
+            self.path('tag', tag_id), '%s - %s' % (self.title, tag.name),
+            reverse('tag-list', args=[tag_id]), reverse('rss-tag', args=[tag_id]),
+            Post.objects.filter(tag__id=tag_id),
+        )
+        return True
 
-    def item_description(self, item):
-        return item.desc
+    def build_all(self):
+        """ 重新生成全部订阅源，返回生成的文件数 """
+        count = self.build_main()
+        for category_id in Category.objects.filter(status=Category.STATUS_NORMAL).values_list('id', flat=True):
+            count += self.build_category(category_id)
+        for tag_id in Tag.objects.filter(status=Tag.STATUS_NORMAL).values_list('id', flat=True):
+            count += self.build_tag(tag_id)
+        return count
 
-    def item_link(self, item):
-        return reverse('post-detail', args=[item.pk])  # 从URLConfig里获取链接
+    def _write(self, path, title, link, feed_url, queryset):
+        site_url = self.site_url
+        feed = ExtendedRSSFeed(
+            title=title,
+            link=site_url + link,
+            description=self.description,
+            feed_url=site_url + feed_url,
+            language=settings.LANGUAGE_CODE,
+        )
+        posts = queryset.filter(status=Post.STATUS_NORMAL).only(
+            'id', 'title', 'desc', 'content_html', 'tag_items', 'created_time', 'updated_time',
+        ).order_by('-id')[:self.size]
+        for post in posts:
+            item_link = site_url + reverse('post-detail', args=[post.pk])
+            feed.add_item(
+                title=post.title,
+                link=item_link,
+                description=post.desc,
+                unique_id=item_link,
+                pubdate=post.created_time,
+                updateddate=post.updated_time,
+                categories=[tag['name'] for tag in post.tag_list],  # 标签来自冗余字段，不再逐篇查询
+                content_html=post.content_html,
+            )
+        write_file(path, feed.writeString('utf-8').encode('utf-8'), self.compress)
 
-    def item_extra_kwargs(self, item):
-        return {'content_html': self.item_content_html(item)}
 
-    def item_content_html(self, item):
-        return item.content_html
+feed_builder = FeedBuilder(settings.FEED_ROOT, settings.FEED_SIZE, settings.FEED_GZIP)
@@ -0,0 +1,223 @@
+""" 站内搜索：对标题、摘要、正文和标签名建立倒排索引，中文按单字和二元组（bigram）切分，结果按BM25排序 """
+import atexit
+import bisect
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from html import unescape
+
+from django.conf import settings
+from django.utils.html import strip_tags
+
+from .models import Post
+
+TOKEN_RE = re.compile(r'[a-z0-9]+|[一-鿿]+')
+FIELD_WEIGHTS = (('title', 3), ('tags', 2), ('desc', 1), ('content', 1))  # 各字段中出现一次计入的词频
+K1 = 1.2
+B = 0.75
+MAX_PREFIX_TERMS = 50  # 英文、数字的查询词按前缀匹配时最多展开的索引词数
+
+
+def tokenize(text):
+    """
+    建立索引用：英文、数字按单词切分（转为小写），连续的中文切分为单字和相邻两个字，
+    如'中文分词' -> ['中', '文', '分', '词', '中文', '文分', '分词']，使单字查询也能命中
+    """
+    tokens = []
+    for chunk in TOKEN_RE.findall(text.lower()):
+        if is_cjk(chunk):
+            tokens.extend(chunk)
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        else:
+            tokens.append(chunk)
+    return tokens
+
+
+def query_terms(query):
+    """ 查询用：连续的中文只取二元组（单字时取单字），比单字更准确；英文、数字之后按前缀匹配 """
+    terms = []
+    for chunk in TOKEN_RE.findall(query.lower()):
+        if is_cjk(chunk) and len(chunk) > 1:
+            terms.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        else:
+            terms.append(chunk)
+    return set(terms)
+
+
+def is_cjk(chunk):
+    return chunk[0] >= '一'
+
+
+class SearchIndex:
+    """
+    倒排索引保存在内存中，修改后最多save_delay秒整体写入一次磁盘（先写临时文件再替换），
+    连续保存多篇文章时只写一次；进程正常退出时写入剩余的修改（atexit）。
+    查询时如果发现磁盘上的文件被其他进程更新过，则重新加载，并重新应用本进程尚未写入的修改。
+    多个进程同时修改时仍可能互相覆盖，可用rebuild_search_index命令重建。
+    """
+    def __init__(self, path, save_delay=0):
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._dirty = set()  # 已修改、尚未写入磁盘的文章id
+        self._timer = None
+        self._sorted_terms = None  # 英文、数字索引词的有序列表，用于前缀匹配，索引修改后重新生成
+        self.postings = {}  # {词: {文章id: 加权词频}}
+        self.doc_terms = {}  # {文章id: {词: 加权词频}}，用于更新、删除文章时找到它的所有词
+        self.doc_len = {}  # {文章id: 加权后的文档长度}
+
+    def search(self, query, limit=None):
+        """ 返回[(文章id, 得分), ...]，按得分从高到低排序 """
+        terms = query_terms(query)
+        with self._lock:
+            self._reload()
+            total = len(self.doc_len)
+            if not terms or not total:
+                return []
+            avg_len = sum(self.doc_len.values()) / total
+            scores = Counter()
+            for term in terms:
+                postings = self._match(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = K1 * (1 - B + B * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores.most_common(limit)
+
+    def _match(self, term):
+        """
+        返回查询词命中的{文章id: 词频}：中文为精确匹配；英文、数字匹配以它开头的索引词（如'djan'匹配'django'），
+        多个索引词的词频按文章相加，视为同一个词计算得分
+        """
+        if is_cjk(term):
+            return self.postings.get(term)
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(term for term in self.postings if not is_cjk(term))
+        start = bisect.bisect_left(self._sorted_terms, term)
+        matched = {}
+        for word in self._sorted_terms[start:start + MAX_PREFIX_TERMS]:
+            if not word.startswith(term):
+                break
+            for doc_id, tf in self.postings[word].items():
+                matched[doc_id] = matched.get(doc_id, 0) + tf
+        return matched
+
+    def update_posts(self, post_ids):
+        """ 按文章的最新数据更新索引：已发布的重新索引，其余（草稿、删除、不存在）从索引中移除 """
+        if not post_ids:
+            return
+        rows = self._rows(post_ids)
+        with self._lock:
+            self._reload()
+            self._apply(post_ids, rows)
+            self._dirty.update(post_ids)
+        if self.save_delay:
+            self._schedule()
+        else:
+            self.flush()
+
+    def rebuild(self):
+        """ 从数据库重建整个索引（冷启动或索引损坏时使用），立即写入磁盘，返回索引的文章数 """
+        rows = Post.objects.filter(status=Post.STATUS_NORMAL).values(*self.fields())
+        with self._lock:
+            self.postings, self.doc_terms, self.doc_len = {}, {}, {}
+            self._sorted_terms = None
+            for row in rows.iterator():
+                self._add(row)
+            self._save()
+            return len(self.doc_len)
+
+    def flush(self):
+        """ 将尚未写入磁盘的修改写入 """
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _schedule(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.save_delay, self._timer_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timer_flush(self):
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def _rows(self, post_ids):
+        rows = Post.objects.filter(pk__in=post_ids, status=Post.STATUS_NORMAL).values(*self.fields())
+        return {row['id']: row for row in rows}
+
+    def _apply(self, post_ids, rows):
+        for post_id in post_ids:
+            self._remove(post_id)
+            if post_id in rows:
+                self._add(rows[post_id])
+        self._sorted_terms = None
+
+    @staticmethod
+    def fields():
+        return 'id', 'title', 'desc', 'content_html', 'tag_items'
+
+    def _add(self, row):
+        texts = {
+            'title': row['title'],
+            'tags': ' '.join(name for tag_id, name in json.loads(row['tag_items'])),
+            'desc': row['desc'],
+            'content': unescape(strip_tags(row['content_html'])),
+        }
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(texts[field]):
+                terms[term] += weight
+        doc_id = row['id']
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_terms[doc_id] = dict(terms)
+        self.doc_len[doc_id] = sum(terms.values())
+
+    def _remove(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.doc_len.pop(doc_id, None)
+
+    def _reload(self):
+        """ 首次使用或磁盘上的索引被更新过时重新加载；索引文件不存在时从数据库建立 """
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._mtime is None:
+                self.rebuild()
+            return
+        if mtime != self._mtime:
+            with open(self.path, 'rb') as f:
+                self.postings, self.doc_terms, self.doc_len = pickle.load(f)
+            self._sorted_terms = None
+            self._mtime = mtime
+            if self._dirty:
+                self._apply(list(self._dirty), self._rows(list(self._dirty)))  # 其他进程写入的索引中没有本进程的修改
+
+    def _save(self):
+        temp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump((self.postings, self.doc_terms, self.doc_len), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+        self._dirty.clear()
+
+
+search_index = SearchIndex(settings.SEARCH_INDEX_PATH, settings.SEARCH_INDEX_SAVE_DELAY)
+atexit.register(search_index.flush)  # 进程退出前写入剩余的修改
@@ -1,8 +1,17 @@
 """ RESTful（API）的序列化参数配置（序列化类似于表单格式）,这部分有点类似ModelForm,将这里的配置交给apis.py（相当于View层） """
+import json
+
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
 from rest_framework import serializers
-from rest_framework import pagination  # 为分类下显示文章列表提供页码功能
+from rest_framework.reverse import reverse
 
 from .models import Post, Category
+from .pagination import PostCursorPagination  # 为分类下显示文章列表提供翻页功能
+
+CREATED_TIME_FORMAT = '%y-%m-%d %H:%M:%S'
+POST_ROW_FIELDS = ('id', 'title', 'category__name', 'tag_items', 'owner__username', 'created_time')
+URL_PLACEHOLDER = '__pk__'
 
 
 class PostSerializer(serializers.ModelSerializer):
@@ -14,18 +23,17 @@ class PostSerializer(serializers.ModelSerializer):
         slug_field='name'  # 要显示的字段
     )
 
-    tag = serializers.SlugRelatedField(
-        many=True,  # 是否为多对多字段
-        read_only=True,
-        slug_field='name'
-    )
+    tag = serializers.SerializerMethodField()  # 标签名来自冗余字段tag_items，不再逐篇查询
 
     owner = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username'
     )
 
-    created_time = serializers.DateTimeField(format='%y-%m-%d %H:%M:%S')
+    created_time = serializers.DateTimeField(format=CREATED_TIME_FORMAT)
+
+    def get_tag(self, obj):
+        return [tag['name'] for tag in obj.tag_list]
 
     class Meta:
         model = Post
@@ -40,11 +48,13 @@ class PostDetailSerializer(PostSerializer):
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    """ 分类数据的API序列化参数配置 """
+    """ 分类数据的API序列化参数配置（post_count来自查询集的注解，见annotate_post_stats） """
+    post_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Category
         fields = (
-            'id', 'name', 'created_time',
+            'id', 'name', 'created_time', 'post_count',
         )
 
 
@@ -56,12 +66,13 @@ class CategoryDetailSerializer(CategorySerializer):
 
     def paginated_posts(self, obj):  # 固定写法，obj为当前的[分类]对象
         posts = obj.post_set.filter(status=Post.STATUS_NORMAL)  # 关联模型小写_set表示当前关联对象的列表，即该分类下的文章列表
-        paginator = pagination.PageNumberPagination()  # 分页工具
-        page = paginator.paginate_queryset(posts, self.context['request'])
-        serializer = PostSerializer(page, many=True, context={'request': self.context['request']})
+        paginator = PostCursorPagination()  # 分页工具（游标分页）
+        request = self.context['request']
+        page = paginator.paginate_queryset(post_rows(posts), request)
+        url_template = post_url_template(request, self.context.get('format'))
         return {
-            'count': posts.count(),
-            'results': serializer.data,
+            'count': obj.post_count,  # 来自查询集的注解，不再单独COUNT
+            'results': [post_row_data(row, url_template) for row in page],
             'previous': paginator.get_previous_link(),
             'next': paginator.get_next_link(),
         }
@@ -69,3 +80,61 @@ class CategoryDetailSerializer(CategorySerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'created_time', 'posts']
+
+
+def post_rows(queryset, detail=False):
+    """
+    文章API的快速路径：只取出序列化需要的列，分类名、作者名通过JOIN一并取出，标签来自冗余字段tag_items，
+    因此无论多少篇文章都只有一条查询，返回values()查询集（可以直接交给分页器）
+    """
+    fields = POST_ROW_FIELDS + ('content_html',) if detail else POST_ROW_FIELDS
+    return queryset.values(*fields)
+
+
+def post_url_template(request, format=None):
+    """ 文章详情API的URL模板，每行只需替换其中的id，不必逐行reverse """
+    return reverse('api-post-detail', kwargs={'pk': URL_PLACEHOLDER}, request=request, format=format)
+
+
+def post_row_data(row, url_template=None):
+    """ 将post_rows()的一行转为与PostSerializer（url_template为None时与PostDetailSerializer）输出相同的字典 """
+    data = {'url': url_template.replace(URL_PLACEHOLDER, str(row['id']))} if url_template else {}
+    data['id'] = row['id']
+    data['title'] = row['title']
+    data['category'] = row['category__name']
+    data['tag'] = [name for tag_id, name in json.loads(row['tag_items'])]
+    data['owner'] = row['owner__username']
+    if url_template is None:
+        data['content_html'] = row['content_html']
+    data['created_time'] = timezone.localtime(row['created_time']).strftime(CREATED_TIME_FORMAT)
+    return data
+
+
+def annotate_post_stats(queryset, posts_limit=0):
+    """
+    为分类查询集加上post_count（已发布的文章数）；posts_limit大于0时再加上post_cutoff，即该分类第posts_limit新的文章id
+    （文章不足posts_limit篇时为None），两者都由分类的同一条查询完成
+    """
+    queryset = queryset.annotate(post_count=Count('post', filter=Q(post__status=Post.STATUS_NORMAL)))
+    if posts_limit > 0:
+        newest = Post.objects.filter(category=OuterRef('pk'), status=Post.STATUS_NORMAL).order_by('-id')
+        queryset = queryset.annotate(post_cutoff=Subquery(newest.values('id')[posts_limit - 1:posts_limit]))
+    return queryset
+
+
+def category_posts(categories, url_template):
+    """ 用一条查询取出每个分类最新的若干篇文章（id不小于post_cutoff的），返回{分类id: [文章数据, ...]} """
+    condition = Q()
+    for category in categories:
+        if not category.post_count:
+            continue
+        if category.post_cutoff is None:
+            condition |= Q(category_id=category.id)
+        else:
+            condition |= Q(category_id=category.id, id__gte=category.post_cutoff)
+    result = {category.id: [] for category in categories}
+    if condition:
+        rows = post_rows(Post.objects.filter(condition, status=Post.STATUS_NORMAL).order_by('-id'))
+        for row in rows.values(*POST_ROW_FIELDS + ('category_id',)):
+            result[row['category_id']].append(post_row_data(row, url_template))
+    return result
@@ -0,0 +1,269 @@
+""" 信号处理：模型变更后同步更新由它派生出的数据（在apps.py的ready中导入） """
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from config.models import Link, SideBar
+from comment.models import Comment
+from comment.recent import recent_comments
+
+from .chrome import chrome
+from .models import Category, Tag, Post
+from .pagecache import purge
+from .ranking import hot_ranking
+from .rss import feed_builder
+from .search import search_index
+from .sitemap import sitemap_builder
+from .suggest import suggest_index
+from .watermark import post_watermark, category_watermark, tag_watermark, comment_watermark, chrome_watermark
+
+
+@receiver(post_save, sender=Post)
+def update_hot_ranking(sender, instance, **kwargs):
+    """ 文章保存（包括状态变化）后增量更新热门排行 """
+    hot_ranking.update_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_hot_ranking(sender, instance, **kwargs):
+    hot_ranking.remove(instance.id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SideBar)
+@receiver(post_delete, sender=SideBar)
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def invalidate_chrome(sender, **kwargs):
+    """ 导航、侧边栏依赖的数据发生变化，使站点公共部分的快照失效 """
+    chrome.invalidate()
+    chrome_watermark.touch()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    """ 清除显示该文章的页面，以及它可能新出现在其中的列表页 """
+    tags = [
+        'post:%s' % instance.id, 'list:index', 'list:search',
+        'list:category:%s' % instance.category_id, 'list:author:%s' % instance.owner_id,
+    ]
+    if kwargs.get('signal') is post_save:
+        tags += ['list:tag:%s' % tag_id for tag_id in instance.tag.values_list('id', flat=True)]
+    purge(*tags)
+
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def purge_tag_pages(sender, instance, action, pk_set, **kwargs):
+    """ 文章的标签变化后清除相关的标签列表页 """
+    if action == 'pre_clear':  # clear()不提供pk_set，在清空前查出来
+        related = instance.tag if isinstance(instance, Post) else instance.post_set
+        pk_set = set(related.values_list('id', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if isinstance(instance, Post):
+        purge('post:%s' % instance.id, *['list:tag:%s' % tag_id for tag_id in pk_set])
+    else:  # 从Tag一侧修改
+        purge('list:tag:%s' % instance.id, *['post:%s' % post_id for post_id in pk_set])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def purge_category_pages(sender, instance, **kwargs):
+    purge('category:%s' % instance.id, 'list:category:%s' % instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def purge_tag_name_pages(sender, instance, **kwargs):
+    """ 标签名显示在所有列表页的文章卡片中 """
+    purge('tags', 'list:tag:%s' % instance.id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    """ 评论提交、审核通过、删除后清除所在页面，并使该目标缓存的评论分页失效 """
+    purge('comments:%s' % instance.target)
+    Comment.invalidate(instance.target)
+
+
+@receiver(post_save, sender=Comment)
+def update_recent_comments(sender, instance, **kwargs):
+    """ 评论审核通过（或被修改、改为删除状态）后增量更新最近评论列表 """
+    recent_comments.update(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_recent_comment(sender, instance, **kwargs):
+    recent_comments.remove(instance.id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def refresh_recent_comment_titles(sender, instance, **kwargs):
+    """ 最近评论中带有文章标题，文章改名、下线或删除后更新 """
+    recent_comments.refresh_post(instance.id)
+
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def sync_post_tag_items(sender, instance, action, pk_set, **kwargs):
+    """ 文章与标签的关系变化后，同步文章的标签冗余字段 """
+    if action == 'pre_clear' and not isinstance(instance, Post):
+        instance._cleared_post_ids = list(instance.post_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Post):
+        Post.sync_tag_items([instance.id])
+    elif action == 'post_clear':
+        Post.sync_tag_items(instance._cleared_post_ids)
+    else:  # 从Tag一侧修改，pk_set为文章id
+        Post.sync_tag_items(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def sync_renamed_tag_items(sender, instance, created, **kwargs):
+    """ 标签改名后，同步使用该标签的文章的冗余字段 """
+    if not created:
+        Post.sync_tag_items(list(instance.post_set.values_list('id', flat=True)))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_posts(sender, instance, **kwargs):
+    """ 删除标签时关联记录会被级联删除，先记下受影响的文章 """
+    instance._post_ids = list(instance.post_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def sync_deleted_tag_items(sender, instance, **kwargs):
+    Post.sync_tag_items(getattr(instance, '_post_ids', []))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_search_index(sender, instance, **kwargs):
+    """ 文章保存或删除后增量更新搜索索引（草稿、已删除的文章会从索引中移除） """
+    search_index.update_posts([instance.id])
+
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def update_search_index_tags(sender, instance, action, pk_set, **kwargs):
+    """ 标签名也在索引中，文章的标签变化后（此时冗余字段已由sync_post_tag_items同步）重新索引 """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Post):
+        search_index.update_posts([instance.id])
+    elif action == 'post_clear':
+        search_index.update_posts(instance._cleared_post_ids)
+    else:
+        search_index.update_posts(list(pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_search_index_tag_name(sender, instance, **kwargs):
+    """ 标签改名或删除后重新索引使用它的文章 """
+    post_ids = getattr(instance, '_post_ids', None)
+    if post_ids is None:
+        post_ids = list(instance.post_set.values_list('id', flat=True))
+    search_index.update_posts(post_ids)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Post.tag.through)
+def invalidate_suggest_index(sender, **kwargs):
+    """ 标题、名称、状态或文章数变化后，使搜索建议的数组在下次查询时重建 """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        suggest_index.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(m2m_changed, sender=Post.tag.through)
+def touch_post_watermark(sender, **kwargs):
+    """ 文章及其标签变化后更新文章的修改水位（条件GET的校验值随之改变） """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        post_watermark.touch()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def touch_category_watermark(sender, **kwargs):
+    category_watermark.touch()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def touch_tag_watermark(sender, **kwargs):
+    """ 标签改名、删除时文章的标签冗余字段也被更新，因此同时更新文章的修改水位 """
+    tag_watermark.touch()
+    post_watermark.touch()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_comment_watermark(sender, **kwargs):
+    comment_watermark.touch()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_sitemap(sender, instance, **kwargs):
+    """ 文章发布、修改、删除后只重新生成它所在的站点地图分片 """
+    sitemap_builder.update_post(instance.id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_category(sender, instance, **kwargs):
+    """ 记录文章原来的分类，修改分类后原分类的订阅源也需要重新生成 """
+    instance._old_category_id = None
+    if instance.pk:
+        instance._old_category_id = Post.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_feeds(sender, instance, **kwargs):
+    """ 文章发布、修改、删除后重新生成全站、所属分类（包括原分类）和标签的订阅源 """
+    category_ids = {instance.category_id, getattr(instance, '_old_category_id', None)} - {None}
+    feed_builder.update(category_ids, [tag['id'] for tag in instance.tag_list])
+
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def update_tag_feeds(sender, instance, action, pk_set, **kwargs):
+    """ 文章与标签的关系变化后重新生成相关的订阅源（此时冗余字段已由sync_post_tag_items同步） """
+    if action == 'pre_clear' and isinstance(instance, Post):
+        instance._cleared_tag_ids = list(instance.tag.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Post):
+        tag_ids = instance._cleared_tag_ids if action == 'post_clear' else pk_set
+        feed_builder.update([instance.category_id], tag_ids)
+    else:  # 从Tag一侧修改，pk_set为文章id
+        post_ids = instance._cleared_post_ids if action == 'post_clear' else pk_set
+        category_ids = Post.objects.filter(pk__in=post_ids).values_list('category_id', flat=True)
+        feed_builder.update(category_ids, [instance.id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_category_feed(sender, instance, **kwargs):
+    """ 分类改名、删除后重新生成（或删除）它的订阅源 """
+    feed_builder.build_category(instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_tag_feed(sender, instance, **kwargs):
+    """ 标签改名、删除后重新生成（或删除）它的订阅源，全站订阅源中的标签名也随之更新 """
+    feed_builder.build_tag(instance.id)
+    feed_builder.build_main()
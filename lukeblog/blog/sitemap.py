@@ -1,19 +1,134 @@
-from django.contrib.sitemaps import Sitemap
+""" 预生成的分片站点地图：sitemap.xml为索引，sitemap-<k>.xml包含id在[k*分片大小, (k+1)*分片大小)内的已发布文章 """
+import datetime
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.xmlutils import SimplerXMLGenerator
 
 from .models import Post
+from .prerender import get_site_url, write_file, remove_file
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+INDEX_NAME = 'sitemap.xml'
+SHARD_NAME = 'sitemap-%d.xml'
+SHARD_RE = re.compile(r'^sitemap-(\d+)\.xml$')
+URL_SENTINEL = '918273645'  # 生成分片时只reverse一次，得到文章URL的模板后逐行替换其中的id
 
 
-class PostSitemap(Sitemap):
+class SitemapBuilder:
+    """
+    按id范围分片，文章发布、修改、删除时只重新生成它所在的分片（流式读取该范围内的文章）和索引；
+    分片大小固定，因此文章id决定了它在哪个分片，不需要记录映射关系。shard_size不能超过50000（单个站点地图的URL上限）
+    """
     changefreq = 'always'
-    priority = 1.0
-    protocol = 'https'
+    priority = '1.0'
+
+    def __init__(self, root, shard_size, compress):
+        self.root = root
+        self.shard_size = shard_size
+        self.compress = compress
+
+    @property
+    def site_url(self):
+        return get_site_url()
+
+    def shard_of(self, post_id):
+        return post_id // self.shard_size
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def update_post(self, post_id):
+        """ 文章变化后重新生成它所在的分片和索引 """
+        self.build_shard(self.shard_of(post_id))
+        self.build_index()
+
+    def build_shard(self, shard):
+        """ 重新生成一个分片，该范围内没有已发布的文章时删除分片文件；返回分片中的文章数 """
+        start = shard * self.shard_size
+        rows = Post.objects.filter(
+            status=Post.STATUS_NORMAL, id__gte=start, id__lt=start + self.shard_size,
+        ).order_by('id').values_list('id', 'updated_time')
+        count = self._write_shard(shard, rows.iterator())
+        if not count:
+            remove_file(self.path(SHARD_NAME % shard))
+        return count
+
+    def build_all(self):
+        """ 流式遍历全部已发布的文章，逐个写出分片，删除多余的旧分片，最后生成索引；返回文章总数 """
+        rows = Post.objects.filter(status=Post.STATUS_NORMAL).order_by('id').values_list('id', 'updated_time')
+        total = 0
+        written = set()
+        shard, buffer = None, []
+        for row in rows.iterator():
+            if self.shard_of(row[0]) != shard:
+                if buffer:
+                    total += self._write_shard(shard, buffer)
+                    written.add(shard)
+                shard, buffer = self.shard_of(row[0]), []
+            buffer.append(row)
+        if buffer:
+            total += self._write_shard(shard, buffer)
+            written.add(shard)
+        for old_shard in set(self.shards()) - written:
+            remove_file(self.path(SHARD_NAME % old_shard))
+        self.build_index()
+        return total
+
+    def build_index(self):
+        """ 按磁盘上现有的分片生成索引，lastmod为分片文件的修改时间 """
+        output = BytesIO()
+        xml = SimplerXMLGenerator(output, 'utf-8')
+        xml.startDocument()
+        xml.startElement('sitemapindex', {'xmlns': SITEMAP_NS})
+        for shard in self.shards():
+            mtime = os.path.getmtime(self.path(SHARD_NAME % shard))
+            xml.startElement('sitemap', {})
+            xml.addQuickElement('loc', '%s%s' % (self.site_url, reverse('sitemap-shard', args=[shard])))
+            xml.addQuickElement('lastmod', self._format_time(datetime.datetime.fromtimestamp(mtime, timezone.utc)))
+            xml.endElement('sitemap')
+        xml.endElement('sitemapindex')
+        xml.endDocument()
+        write_file(self.path(INDEX_NAME), output.getvalue(), self.compress)
+
+    def shards(self):
+        """ 磁盘上现有的分片号（升序） """
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(int(match.group(1)) for match in map(SHARD_RE.match, names) if match)
+
+    def _write_shard(self, shard, rows):
+        output = BytesIO()
+        xml = SimplerXMLGenerator(output, 'utf-8')
+        xml.startDocument()
+        xml.startElement('urlset', {'xmlns': SITEMAP_NS})
+        url_template = self.site_url + reverse('post-detail', args=[URL_SENTINEL])
+        count = 0
+        for post_id, updated_time in rows:
+            xml.startElement('url', {})
+            xml.addQuickElement('loc', url_template.replace(URL_SENTINEL, str(post_id)))
+            xml.addQuickElement('lastmod', self._format_time(updated_time))
+            xml.addQuickElement('changefreq', self.changefreq)
+            xml.addQuickElement('priority', self.priority)
+            xml.endElement('url')
+            count += 1
+        xml.endElement('urlset')
+        xml.endDocument()
+        if count:
+            write_file(self.path(SHARD_NAME % shard), output.getvalue(), self.compress)
+        return count
 
-    def items(self):
-        return Post.objects.filter(status=Post.STATUS_NORMAL)
+    @staticmethod
+    def _format_time(value):
+        return timezone.localtime(value).isoformat(timespec='seconds')
 
-    def lastmod(self, obj):
-        return obj.created_time
 
-    def location(self, obj):
-        return reverse('post-detail', args=[obj.pk])
+sitemap_builder = SitemapBuilder(
+    settings.SITEMAP_ROOT, settings.SITEMAP_SHARD_SIZE, settings.SITEMAP_GZIP,
+)
@@ -0,0 +1,110 @@
+""" 搜索建议（输入即提示）：文章标题、标签、分类名按前缀匹配，数据保存在进程内的有序数组中，用二分查找定位前缀范围 """
+import threading
+from bisect import bisect_left
+from heapq import nlargest
+
+from django.conf import settings
+from django.db.models import Count
+
+from .generation import CacheGeneration
+from .models import Category, Tag, Post
+
+KINDS = ('post', 'tag', 'category')
+
+
+class SuggestIndex:
+    """
+    每种数据一个按键排序的数组，元素为(键, 权重, id, 名称, 是否公开)，键为小写的名称，
+    英文标题中每个单词开头的部分也会作为键（如'hello world'也可以用'wor'匹配）。
+    文章、标签、分类变化时由信号调用invalidate()使世代号加1，各进程在下次查询时重建数组。
+    前缀很短时匹配范围较大，其结果会被记录下来，直到下次重建。
+    """
+    def __init__(self, top_k):
+        self.top_k = top_k
+        self._generation = CacheGeneration('suggest:generation')
+        self._local_generation = None
+        # ({类型: [键, ...]}, {类型: [(键, 权重, id, 名称, 是否公开), ...]}, {(类型, 短前缀): 结果})，整体替换以保证一致
+        self._data = ({kind: [] for kind in KINDS}, {kind: [] for kind in KINDS}, {})
+        self._lock = threading.Lock()
+
+    def suggest(self, prefix, limit=None):
+        """ 返回{'post': [...], 'tag': [...], 'category': [...]}，每类最多limit项，按权重（文章pv、标签和分类下的文章数）排序 """
+        limit = min(limit or self.top_k, self.top_k)
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+        data = self._ensure()
+        return {kind: [dict(item) for item in self._top(data, kind, prefix)[:limit]] for kind in KINDS}
+
+    def match_ids(self, kind, prefix):
+        """ 返回名称以prefix开头的全部id（包括未公开的，供后台自动补全使用） """
+        data = self._ensure()
+        return {entry[2] for entry in self._range(data, kind, prefix.strip().lower())}
+
+    def invalidate(self):
+        self._generation.bump()
+
+    def _top(self, data, kind, prefix):
+        memo = data[2]
+        memo_key = (kind, prefix)
+        result = memo.get(memo_key)
+        if result is None:
+            result = []
+            seen = set()
+            for key, weight, obj_id, name, public in nlargest(
+                    self.top_k * 4, self._range(data, kind, prefix), key=lambda entry: entry[1]):
+                if public and obj_id not in seen:
+                    seen.add(obj_id)
+                    result.append({'id': obj_id, 'name': name})
+            result = result[:self.top_k]
+            if len(prefix) <= 2:
+                memo[memo_key] = result
+        return result
+
+    @staticmethod
+    def _range(data, kind, prefix):
+        keys = data[0][kind]
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', start)
+        return data[1][kind][start:end]
+
+    def _ensure(self):
+        """ 世代号变化时重建，返回当前数据 """
+        generation = self._generation.get()
+        if generation != self._local_generation:
+            with self._lock:
+                if generation != self._local_generation:
+                    self._data = self._build()
+                    self._local_generation = generation
+        return self._data
+
+    def _build(self):
+        sources = {
+            'post': (Post, Post.objects.filter(status=Post.STATUS_NORMAL).values_list('id', 'title', 'pv', 'status')),
+            'tag': (Tag, Tag.objects.annotate(weight=Count('post')).values_list('id', 'name', 'weight', 'status')),
+            'category': (Category, Category.objects.annotate(weight=Count('post')).values_list(
+                'id', 'name', 'weight', 'status')),
+        }
+        keys, entries = {}, {}
+        for kind, (model, queryset) in sources.items():
+            items = []
+            for obj_id, name, weight, status in queryset:
+                public = status == model.STATUS_NORMAL
+                for key in self._keys_of(name):
+                    items.append((key, weight, obj_id, name, public))
+            items.sort()
+            keys[kind] = [item[0] for item in items]
+            entries[kind] = items
+        return keys, entries, {}
+
+    @staticmethod
+    def _keys_of(name):
+        name = name.lower()
+        keys = [name]
+        for i, char in enumerate(name):
+            if char == ' ' and i + 1 < len(name) and name[i + 1] != ' ':
+                keys.append(name[i + 1:])
+        return keys
+
+
+suggest_index = SuggestIndex(settings.SUGGEST_TOP_K)
@@ -1,3 +1,284 @@
-from django.test import TestCase
+import io
+import os
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from lukeblog import bench
+from .checks import check_shared_cache
+from .counter import VisitCounter, record_visit
+from .hyperloglog import HyperLogLog
+from .models import Category, Post
+from .ranking import hot_ranking
+from .rss import feed_builder
+from .search import SearchIndex, query_terms, tokenize
+from .sitemap import SHARD_NAME, sitemap_builder
+
+
+class IsolatedTestCase(TestCase):
+    """ 缓存和预生成文件（搜索索引、站点地图、RSS、评论队列等）使用临时目录，不影响正在运行的站点 """
+    def setUp(self):
+        environment = bench.isolated_environment()
+        self.root = environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+
+    def create_post(self, title='标题', content='正文', status=Post.STATUS_NORMAL, **kwargs):
+        if not hasattr(self, 'user'):
+            self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+            self.category = Category.objects.create(name='分类', owner=self.user)
+        return Post.objects.create(title=title, desc=content[:20], content=content, status=status,
+                                   category=self.category, owner=self.user, **kwargs)
+
+
+class PostAPITests(IsolatedTestCase):
+    def test_retrieve(self):
+        post = self.create_post()
+        response = self.client.get('/api/post/%s/' % post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], post.title)
+
+    def test_retrieve_missing_or_invalid_pk(self):
+        """ 不存在的id和格式不对的id都返回404，不能是500 """
+        self.create_post()
+        self.assertEqual(self.client.get('/api/post/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/post/abc/').status_code, 404)
+
+
+class VisitBeaconTests(IsolatedTestCase):
+    def post_events(self, body):
+        return self.client.post('/beacon/', body, content_type='application/json')
+
+    def test_records_visit(self):
+        from .counter import visit_counter
+
+        post = self.create_post()
+        response = self.post_events('{"events": [{"post_id": %d}]}' % post.id)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(visit_counter.get_delta(post.id), (1, 1))
+        visit_counter.flush()
+
+    def test_invalid_post_id(self):
+        """ 非整数的post_id（包括int()会溢出的1e999、Infinity）返回400，不能是500 """
+        for value in ('1e999', 'Infinity', '-Infinity', 'NaN', '1.5', '"1"', 'true', 'null', '[1]'):
+            with self.subTest(value=value):
+                response = self.post_events('{"events": [{"post_id": %s}]}' % value)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post_events('not json').status_code, 400)
+        self.assertEqual(self.post_events('{"events": [{}]}').status_code, 400)
+
+
+class SearchTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = SearchIndex(os.path.join(self.root, 'test_index.pickle'), save_delay=60)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('中文分词'), ['中', '文', '分', '词', '中文', '文分', '分词'])
+        self.assertEqual(tokenize('Django 3.0 缓存'), ['django', '3', '0', '缓', '存', '缓存'])
+        self.assertEqual(query_terms('中文分词'), {'中文', '文分', '分词'})
+        self.assertEqual(query_terms('缓 Djan'), {'缓', 'djan'})
+
+    def test_search(self):
+        cache_post = self.create_post('缓存的使用', 'Django的缓存框架')
+        blog_post = self.create_post('博客', '用python写一个博客')
+        self.create_post('草稿中的缓存', '缓存', status=Post.STATUS_DRAFT)
+        self.index.rebuild()
+
+        self.assertEqual([doc_id for doc_id, score in self.index.search('缓存')], [cache_post.id])
+        self.assertEqual([doc_id for doc_id, score in self.index.search('缓')], [cache_post.id])  # 单字
+        self.assertEqual([doc_id for doc_id, score in self.index.search('博')], [blog_post.id])
+        self.assertEqual([doc_id for doc_id, score in self.index.search('djan')], [cache_post.id])  # 前缀
+        self.assertEqual([doc_id for doc_id, score in self.index.search('PYTHON')], [blog_post.id])
+        self.assertEqual(self.index.search('不存在'), [])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_update_posts(self):
+        post = self.create_post('缓存', '正文')
+        self.index.rebuild()
+        Post.objects.filter(pk=post.pk).update(title='索引', status=Post.STATUS_NORMAL)
+        self.index.update_posts([post.id])
+        self.assertEqual(self.index.search('缓存'), [])
+        self.assertEqual([doc_id for doc_id, score in self.index.search('索引')], [post.id])
+        Post.objects.filter(pk=post.pk).update(status=Post.STATUS_DRAFT)
+        self.index.update_posts([post.id])
+        self.assertEqual(self.index.search('索引'), [])
+
+    def test_batched_save(self):
+        """ 修改在flush（或save_delay秒后的定时器）时才写入磁盘，多次修改只写一次 """
+        post = self.create_post('缓存', '正文')
+        self.index.rebuild()
+        mtime = os.path.getmtime(self.index.path)
+        Post.objects.filter(pk=post.pk).update(title='索引')
+        self.index.update_posts([post.id])
+        self.index.update_posts([post.id])
+        self.assertEqual(os.path.getmtime(self.index.path), mtime)
+
+        other = SearchIndex(self.index.path)
+        self.assertEqual([doc_id for doc_id, score in other.search('缓存')], [post.id])
+        self.index.flush()
+        other._mtime = None  # 文件修改时间的精度可能不足以区分两次写入
+        self.assertEqual([doc_id for doc_id, score in other.search('索引')], [post.id])
+
+    def test_reload_keeps_unsaved_changes(self):
+        """ 其他进程写入索引后重新加载时，本进程尚未写入的修改不会丢失 """
+        first = self.create_post('缓存', '正文')
+        second = self.create_post('索引', '正文')
+        self.index.rebuild()
+        other = SearchIndex(self.index.path)  # 另一个进程，已加载当前的索引
+        other.search('缓存')
+        Post.objects.filter(pk=first.pk).update(status=Post.STATUS_DRAFT)
+        self.index.update_posts([first.id])  # 尚未写入磁盘
+        other.update_posts([second.id])  # 另一个进程写入的索引中仍有第一篇文章
+        self.index._mtime = None
+        self.assertEqual(self.index.search('缓存'), [])
+        self.assertEqual([doc_id for doc_id, score in self.index.search('索引')], [second.id])
+
+
+class SitemapTests(IsolatedTestCase):
+    @override_settings(SITE_URL='https://blog.example.org/')
+    def test_links_use_site_url(self):
+        post = self.create_post()
+        sitemap_builder.build_all()
+        with open(sitemap_builder.path(SHARD_NAME % sitemap_builder.shard_of(post.id)), encoding='utf-8') as f:
+            self.assertIn('<loc>https://blog.example.org/post/%s.html</loc>' % post.id, f.read())
+
+    def test_requires_site_url(self):
+        post = self.create_post()
+        with self.settings(SITE_URL=''):
+            with self.assertRaises(ImproperlyConfigured):
+                sitemap_builder.build_shard(sitemap_builder.shard_of(post.id))
+
+
+class FeedTests(IsolatedTestCase):
+    @override_settings(SITE_URL='https://blog.example.org/')
+    def test_links_use_site_url(self):
+        post = self.create_post()
+        feed_builder.build_main()
+        with open(feed_builder.path('main'), encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('<link>https://blog.example.org/post/%s.html</link>' % post.id, content)
+        self.assertNotIn('example.com', content)
+
+    def test_requires_site_url(self):
+        self.create_post()
+        with self.settings(SITE_URL=''):
+            with self.assertRaises(ImproperlyConfigured):
+                feed_builder.build_main()
+
+
+class BackfillImagesTests(IsolatedTestCase):
+    @override_settings(SITE_URL='https://blog.example.org/')
+    def test_rewritten_post_is_revalidated(self):
+        """ 改写了正文的文章，修改时间随之更新，详情页原来的ETag不再匹配 """
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(content_html='<p><img src="/media/photo.png"></p>')  # 以前保存的正文
+        etag = self.client.get('/post/%s.html' % post.id)['ETag']
+        self.assertEqual(self.client.get('/post/%s.html' % post.id, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        call_command('backfill_images', '--skip-media', stdout=io.StringIO())
+        self.assertGreater(Post.objects.get(pk=post.pk).updated_time, post.updated_time)
+        response = self.client.get('/post/%s.html' % post.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'loading="lazy"')
+
+
+class VisitCounterTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.counter = VisitCounter(flush_interval=3600, max_pending=10)
+        self.addCleanup(lambda: self.counter._timer and self.counter._timer.cancel())
+
+    def test_flush_in_one_update(self):
+        first, second = self.create_post(), self.create_post()
+        self.counter.incr(first.id, pv=1, uv=1)
+        self.counter.incr(first.id, pv=1)
+        self.counter.incr(second.id, pv=1)
+        self.assertEqual(self.counter.get_delta(first.id), (2, 1))
+        first.refresh_from_db()
+        self.assertEqual((first.pv, first.uv), (1, 1))  # 写回前数据库不变
+
+        with CaptureQueriesContext(connection) as queries:
+            flushed = self.counter.flush()
+        self.assertEqual(flushed, {first.id: (2, 1), second.id: (1, 0)})
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.pv, first.uv, second.pv, second.uv), (3, 2, 2, 1))
+        self.assertEqual(self.counter.get_delta(first.id), (0, 0))
+        self.assertEqual(self.counter.flush(), {})
+
+    def test_flush_when_max_pending_reached(self):
+        post = self.create_post()
+        for i in range(9):
+            self.counter.incr(post.id, pv=1)
+        self.assertEqual(self.counter.get_delta(post.id), (9, 0))
+        self.counter.incr(post.id, pv=1)
+        self.assertEqual(self.counter.get_delta(post.id), (0, 0))
+        post.refresh_from_db()
+        self.assertEqual(post.pv, 11)
+
+    def test_failed_flush_keeps_increments(self):
+        post = self.create_post()
+        self.counter.incr(post.id, pv=2, uv=1)
+        with mock.patch.object(Post.objects, 'filter', side_effect=DatabaseError):
+            with self.assertLogs('blog.counter', 'ERROR'):
+                self.assertEqual(self.counter.flush(), {})
+        self.assertEqual(self.counter.get_delta(post.id), (2, 1))
+        self.counter.flush()
+        post.refresh_from_db()
+        self.assertEqual((post.pv, post.uv), (3, 2))
+
+    def test_record_visit(self):
+        """ 同一uid一分钟内重复访问只计一次pv，uv当天去重 """
+        post = self.create_post()
+        with mock.patch('blog.counter.visit_counter', self.counter):
+            record_visit(post.id, 'uid-a')
+            record_visit(post.id, 'uid-a')
+            record_visit(post.id, 'uid-b')
+        self.assertEqual(self.counter.get_delta(post.id), (2, 2))
+
+
+class HotRankingTests(IsolatedTestCase):
+    def test_save_keeps_fresh_counts(self):
+        """ 用访问计数写回之前取出的实例保存文章，列表中的pv不会退回到实例中的旧值 """
+        post, other = self.create_post('文章'), self.create_post('另一篇')
+        stale = Post.objects.get(pk=post.pk)
+        Post.objects.filter(pk=post.pk).update(pv=100)
+        Post.objects.filter(pk=other.pk).update(pv=50)
+        hot_ranking.update_posts([post.id, other.id])
+        self.assertEqual([entry['id'] for entry in hot_ranking.get()][:2], [post.id, other.id])
+
+        stale.title = '修改标题'
+        stale.save()
+        entries = hot_ranking.get()
+        self.assertEqual([(entry['id'], entry['pv']) for entry in entries][:2], [(post.id, 100), (other.id, 50)])
+        self.assertEqual(entries[0]['title'], '修改标题')
+
+
+class ChecksTests(TestCase):
+    def test_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([message.id for message in check_shared_cache(None)], ['blog.W001'])
+
+
+class HyperLogLogTests(TestCase):
+    def test_count(self):
+        hll = HyperLogLog(10)
+        self.assertEqual(hll.count(), 0)
+        self.assertTrue(hll.add('uid-0'))
+        self.assertFalse(hll.add('uid-0'))  # 重复的uid不改变草图
+        for i in range(10000):
+            hll.add('uid-%d' % i)
+        self.assertAlmostEqual(hll.count(), 10000, delta=10000 * 0.1)
+
+    def test_to_bytes(self):
+        hll = HyperLogLog(10)
+        for i in range(100):
+            hll.add('uid-%d' % i)
+        self.assertEqual(HyperLogLog(10, hll.to_bytes()).count(), hll.count())
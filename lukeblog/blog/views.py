@@ -1,16 +1,27 @@
-from datetime import date
-
-from django.core.cache import cache
-
-from django.db.models import Q, F  # Q解决关键字搜索...or...的问题, F解决数据库原子查询
-from django.views.generic import DetailView, ListView
+import json
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import DetailView, ListView, View
 from django.shortcuts import get_object_or_404
 
-from config.models import SideBar
 from comment.models import Comment
 from comment.forms import CommentForm
 
 from .models import Post, Tag, Category
+from .chrome import chrome
+from .conditional import ConditionalGetMixin, make_validators
+from .pagecache import PageCacheMixin
+from .pagination import KeysetPage, KeysetPaginationMixin
+from .prerender import serve_file
+from .rss import feed_builder
+from .search import search_index
+from .sitemap import sitemap_builder, INDEX_NAME, SHARD_NAME
+from .counter import record_visit
+from .watermark import post_watermark, category_watermark, tag_watermark, comment_watermark, chrome_watermark
 
 
 class CommonViewMixin:
@@ -19,26 +30,38 @@ class CommonViewMixin:
         """ 通过重写该方法(所有类视图都继承该方法)可以[增加]视图的上下文键值对，后面的类视图与这里一样用法，共3步 """
         # 第1步：获取父类中的数据
         context = super().get_context_data(**kwargs)
-        # 第2步：增加新键值对
-        context.update({
-            'sidebars': SideBar.get_all(),  # 侧边栏功能
-        })
-        context.update(Category.get_navs())  # 导航功能
+        # 第2步：增加新键值对（导航、底部分类和侧边栏HTML来自快照，只有相关数据变化时才重新查询、渲染）
+        context.update(chrome.get())
         # 第3步：返回新的数据
         return context
 
 
-class IndexView(CommonViewMixin, ListView):
-    """ 通用索引视图 """
+class IndexView(ConditionalGetMixin, PageCacheMixin, KeysetPaginationMixin, CommonViewMixin, ListView):
+    """ 通用索引视图（按id游标分页，见pagination.py） """
     queryset = Post.latest_posts()  # 与Model属性二选一，queryset有过滤功能
     paginate_by = 3  # 每页的数量
     # 如果不设置这里的'post_list'，在模板中该变量就变成默认的'object_list'
     context_object_name = 'post_list'  # 体现在模板中的 {% for post in post_list %}
     template_name = 'blog/list.html'  # 模板所在位置
+    page_cache_list_tag = 'list:index'  # 整页缓存中代表"该列表"的标签，可引用URL参数，如'list:tag:{tag_id}'
+
+    def get_validators(self):
+        """ 列表页依赖文章、分类、标签和站点公共部分，任一变化都使校验值改变（页面中有按用户生成的CSRF token，因此加入用户id） """
+        timestamps = [post_watermark.get(), category_watermark.get(), tag_watermark.get(), chrome_watermark.get()]
+        return make_validators(timestamps, chrome.digest(), self.request.user.pk)
+
+    def get_page_cache_tags(self, context):
+        """ 列表页依赖：列表本身、页面中的每篇文章及其分类，以及标签名 """
+        tags = [self.page_cache_list_tag.format(**self.kwargs), 'tags']
+        for post in context['post_list']:
+            tags += ['post:%s' % post.id, 'category:%s' % post.category_id]
+        return tags
 
 
 class CategoryView(IndexView):
     """ 分类列表视图 """
+    page_cache_list_tag = 'list:category:{category_id}'
+
     def get_context_data(self, **kwargs):
         """ 再次重写该方法，最终目的为了向模板增加新的上下文"category" """
         context = super().get_context_data(**kwargs)
@@ -63,6 +86,8 @@ class CategoryView(IndexView):
 
 class TagView(IndexView):
     """ Tag列表视图 """
+    page_cache_list_tag = 'list:tag:{tag_id}'
+
     def get_context_data(self, **kwargs):
         """ 再次重写该方法，最终目的为了向模板增加新的上下文"tag" """
         context = super().get_context_data(**kwargs)
@@ -81,6 +106,9 @@ class TagView(IndexView):
 
 
 class SearchView(IndexView):
+    """ 搜索结果页：由倒排索引（search.py）按相关度排序，不再对文章表做icontains全表扫描 """
+    page_cache_list_tag = 'list:search'
+
     def get_context_data(self):
         context = super().get_context_data()
         context.update({
@@ -88,16 +116,33 @@ class SearchView(IndexView):
         })
         return context
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
+    def paginate_queryset(self, queryset, page_size):
+        """ 按相关度排序的结果无法用id游标翻页，这里对索引返回的id列表按页码分页，只查询当前页的文章 """
         keyword = self.request.GET.get('keyword')
         if not keyword:
-            return queryset
-        # icontains是忽略大小写的字段查询
-        return queryset.filter(Q(title__icontains=keyword) | Q(desc__icontains=keyword))
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            number = int(self.request.GET.get('page') or 1)
+        except ValueError:
+            raise Http404('无效的页码')
+        ranked_ids = [post_id for post_id, score in search_index.search(keyword, settings.SEARCH_MAX_RESULTS)]
+        start = (number - 1) * page_size
+        page_ids = ranked_ids[start:start + page_size]
+        if number < 1 or (number > 1 and not page_ids):
+            raise Http404('没有更多结果了')
+        posts = queryset.in_bulk(page_ids)
+        rows = [posts[post_id] for post_id in page_ids if post_id in posts]
+        has_next = len(ranked_ids) > start + page_size
+        page = KeysetPage(
+            rows, number, has_next, number > 1,
+            self.page_query(page=number + 1), self.page_query(page=number - 1) if number > 1 else '',
+        )
+        return None, page, rows, page.has_other_pages()
 
 
 class AuthorView(IndexView):
+    page_cache_list_tag = 'list:author:{owner_id}'
+
     def get_context_data(self, **kwargs):
         """ 在返回的页面中增加用户名的显示 """
         context = super().get_context_data(**kwargs)
@@ -115,37 +160,76 @@ class AuthorView(IndexView):
         return queryset.filter(owner_id=author_id)
 
 
-class PostDetailView(CommonViewMixin, DetailView):
+class PostDetailView(ConditionalGetMixin, PageCacheMixin, CommonViewMixin, DetailView):
     queryset = Post.latest_posts()
     template_name = 'blog/detail.html'
     context_object_name = 'post'
     pk_url_kwarg = 'post_id'  # 设置查询的主键名称（与URLconfig的尖括号中一致）
 
-    def get(self, request, *args, **kwargs):
-        """ 重写get方法，增加pv和uv的统计 """
-        response = super().get(request, *args, **kwargs)
-        self.handle_visited()
-        return response
-
-    def handle_visited(self):
-        """ 在访问文章后增加pv和uv的方法 """
-        increase_pv = False
-        increase_uv = False
-        uid = self.request.uid
-        pv_key = 'pv:%s:%s' % (uid, self.request.path)
-        uv_key = 'uv:%s:%s:%s' % (uid, str(date.today()), self.request.path)
-
-        if not cache.get(pv_key):
-            increase_pv = True
-            cache.set(pv_key, 1, 1*60)  # 1分钟有效
-
-        if not cache.get(uv_key):
-            increase_uv = True
-            cache.set(uv_key, 1, 24*60*60)  # 24小时有效
-
-        if increase_pv and increase_uv:
-            Post.objects.filter(pk=self.object.id).update(pv=F('pv') + 1, uv=F('uv') + 1)
-        elif increase_pv:
-            Post.objects.filter(pk=self.object.id).update(pv=F('pv') + 1)
-        elif increase_uv:
-            Post.objects.filter(pk=self.object.id).update(uv=F('uv') + 1)
+    def get_validators(self):
+        """ 详情页依赖文章本身（只查询它的updated_time）、分类名、评论和站点公共部分 """
+        updated_time = Post.objects.filter(
+            pk=self.kwargs['post_id'], status=Post.STATUS_NORMAL,
+        ).values_list('updated_time', flat=True).first()
+        if updated_time is None:
+            return None
+        timestamps = [updated_time, category_watermark.get(), comment_watermark.get(), chrome_watermark.get()]
+        return make_validators(timestamps, chrome.digest(), self.request.user.pk)
+
+    def get_page_cache_tags(self, context):
+        """ 详情页依赖：文章本身、所属分类以及该页面的评论 """
+        post = context['post']
+        return ['post:%s' % post.id, 'category:%s' % post.category_id, 'comments:%s' % self.request.path]
+
+
+@method_decorator(csrf_exempt, name='dispatch')  # 由页面中的navigator.sendBeacon发送，不携带CSRF token
+class VisitBeaconView(View):
+    """
+    访问统计的beacon接口：详情页渲染时不再统计pv/uv（页面因此可以被缓存），由页面加载后的脚本上报，
+    请求体为JSON：{"events": [{"post_id": 1}, ...]}，一次可以上报多个访问事件
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        try:
+            events = json.loads(request.body.decode('utf-8'))['events']
+            post_ids = [event['post_id'] for event in events[:settings.VISIT_BEACON_MAX_EVENTS]]
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest()
+        # 只接受JSON整数：int()会把1e999、Infinity等转换出错（OverflowError），也会把"1"、1.5等当作合法id
+        if not all(isinstance(post_id, int) and not isinstance(post_id, bool) for post_id in post_ids):
+            return HttpResponseBadRequest()
+
+        # 只统计存在且已发布的文章，避免伪造的id产生无用的计数和缓存
+        valid_ids = Post.objects.filter(pk__in=set(post_ids), status=Post.STATUS_NORMAL).values_list('id', flat=True)
+        valid_ids = set(valid_ids)
+        for post_id in post_ids:
+            if post_id in valid_ids:
+                record_visit(post_id, request.uid)
+        return HttpResponse(status=204)
+
+
+class SitemapView(View):
+    """ 返回预生成的站点地图文件（不带shard参数时为索引），首次访问时如果索引尚未生成则全部生成一次 """
+    http_method_names = ['get', 'head']
+
+    def get(self, request, shard=None):
+        if shard is None:
+            path = sitemap_builder.path(INDEX_NAME)
+            if not os.path.exists(path):
+                sitemap_builder.build_all()
+        else:
+            path = sitemap_builder.path(SHARD_NAME % shard)
+        return serve_file(request, path, 'application/xml')
+
+
+class FeedView(View):
+    """ 返回预生成的RSS文件（全站、分类或标签），文件尚未生成时先生成 """
+    http_method_names = ['get', 'head']
+    kind = 'main'
+
+    def get(self, request, obj_id=None):
+        path = feed_builder.path(self.kind, obj_id)
+        if not os.path.exists(path):
+            feed_builder.build(self.kind, obj_id)  # 分类、标签不存在时不会生成文件，serve_file返回404
+        return serve_file(request, path, 'application/rss+xml; charset=utf-8')
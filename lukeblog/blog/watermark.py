@@ -0,0 +1,31 @@
+""" 各类数据的"最后修改时间"水位：数据增删改时由信号更新，生成ETag/Last-Modified时只需读缓存，不必查询整个集合 """
+from django.core.cache import cache
+from django.utils import timezone
+
+WATERMARK_KEY = 'watermark:%s'
+
+
+class Watermark:
+    """
+    保存在共享缓存中（不过期），touch()记录当前时间。删除数据也会touch()，因此不能用 MAX(updated_time) 代替；
+    缓存丢失（如重启、被淘汰）时取当前时间，代价只是客户端重新下载一次，不会把过期的内容当作未修改
+    """
+    def __init__(self, name):
+        self.key = WATERMARK_KEY % name
+
+    def get(self):
+        value = cache.get(self.key)
+        if value is None:
+            cache.add(self.key, timezone.now(), None)
+            value = cache.get(self.key) or timezone.now()
+        return value
+
+    def touch(self):
+        cache.set(self.key, timezone.now(), None)
+
+
+post_watermark = Watermark('post')
+category_watermark = Watermark('category')
+tag_watermark = Watermark('tag')
+comment_watermark = Watermark('comment')
+chrome_watermark = Watermark('chrome')  # 导航、侧边栏等站点公共部分
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from comment.queue import comment_queue
+
+
+class Command(BaseCommand):
+    help = '处理评论提交队列（COMMENT_QUEUE_CONSUMER为False时由单独的进程或定时任务运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续运行，每隔COMMENT_QUEUE_INTERVAL秒处理一次')
+        parser.add_argument('--limit', type=int, default=None, help='本次最多处理的评论数')
+
+    def handle(self, *args, **options):
+        while True:
+            accepted, rejected = comment_queue.process(options['limit'])
+            if accepted or rejected or not options['loop']:
+                self.stdout.write(self.style.SUCCESS('写入%d条评论，丢弃%d条垃圾或重复评论，队列中还有%d条' % (
+                    accepted, rejected, comment_queue.pending())))
+            if not options['loop']:
+                break
+            time.sleep(comment_queue.interval)
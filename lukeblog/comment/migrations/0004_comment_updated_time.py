@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_updated_time(apps, schema_editor):
+    """ 已有评论的修改时间取创建时间 """
+    from django.db.models import F
+
+    apps.get_model('comment', 'Comment').objects.update(updated_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comment', '0003_auto_20200103_1405'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='修改时间'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_time, migrations.RunPython.noop),
+    ]
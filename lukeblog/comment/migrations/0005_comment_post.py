@@ -0,0 +1,42 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+
+def fill_post(apps, schema_editor):
+    """ 评论目标是文章详情页（/post/<id>.html）的评论，关联到对应的文章 """
+    Comment = apps.get_model('comment', 'Comment')
+    Post = apps.get_model('blog', 'Post')
+    target_re = re.compile(r'^/post/(\d+)\.html$')
+
+    comment_ids = {}  # {文章id: [评论id, ...]}
+    for comment_id, target in Comment.objects.values_list('id', 'target').iterator():
+        match = target_re.match(target)
+        if match:
+            comment_ids.setdefault(int(match.group(1)), []).append(comment_id)
+    existing = set(Post.objects.filter(pk__in=list(comment_ids)).values_list('id', flat=True))
+    for post_id in existing:
+        Comment.objects.filter(pk__in=comment_ids[post_id]).update(post_id=post_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_updated_time'),
+        ('comment', '0004_comment_updated_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(blank=True, help_text='评论目标为文章详情页时由评论目标自动填写', null=True, on_delete=django.db.models.deletion.CASCADE, to='blog.Post', verbose_name='文章'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'status', '-id'], name='comment_post_status_id'),
+        ),
+        migrations.RunPython(fill_post, migrations.RunPython.noop),
+    ]
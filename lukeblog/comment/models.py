@@ -1,7 +1,15 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 
+from blog.generation import CacheGeneration
 from blog.models import Post
 
+POST_TARGET_RE = re.compile(r'^/post/(\d+)\.html$')  # 文章详情页的路径，与urls.py中的post-detail一致
+
 
 class Comment(models.Model):
     STATUS_UNAUDITED = 2  # 未审核
@@ -14,16 +22,88 @@ class Comment(models.Model):
     )
 
     target = models.CharField(max_length=100, verbose_name="评论目标")
+    post = models.ForeignKey(Post, null=True, blank=True, on_delete=models.CASCADE, verbose_name="文章",
+                             help_text="评论目标为文章详情页时由评论目标自动填写")
     content = models.CharField(max_length=2000, verbose_name="内容")
     nickname = models.CharField(max_length=50, verbose_name="昵称")
     website = models.URLField(verbose_name="网站")
     email = models.EmailField(verbose_name="邮箱")
     status = models.PositiveIntegerField(default=STATUS_UNAUDITED, choices=STATUS_ITEMS, verbose_name="状态")
     created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    updated_time = models.DateTimeField(auto_now=True, verbose_name="修改时间")
+
+    def save(self, *args, **kwargs):
+        if self.post_id is None:
+            post_id = self.post_id_of(self.target)
+            if post_id is not None and Post.objects.filter(pk=post_id).exists():
+                self.post_id = post_id
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def fill_posts(cls, comments):
+        """ 为一批（用bulk_create写入、不经过save的）评论填写文章，只查询一次 """
+        post_ids = {cls.post_id_of(comment.target) for comment in comments} - {None}
+        existing = set(Post.objects.filter(pk__in=post_ids).values_list('id', flat=True))
+        for comment in comments:
+            post_id = cls.post_id_of(comment.target)
+            if comment.post_id is None and post_id in existing:
+                comment.post_id = post_id
+
+    @staticmethod
+    def post_id_of(target):
+        """ 评论目标是文章详情页时返回文章id，否则返回None """
+        match = POST_TARGET_RE.match(target or '')
+        return int(match.group(1)) if match else None
 
     @classmethod
     def get_by_target(cls, target):
-        return cls.objects.filter(target=target, status=cls.STATUS_NORMAL)
+        """ 文章详情页按文章（有索引）查询，其他页面按评论目标查询 """
+        post_id = cls.post_id_of(target)
+        if post_id is not None:
+            return cls.get_by_post(post_id)
+        return cls.objects.filter(target=target, status=cls.STATUS_NORMAL).order_by('-id')
+
+    @classmethod
+    def get_by_post(cls, post_id):
+        return cls.objects.filter(post_id=post_id, status=cls.STATUS_NORMAL).order_by('-id')
+
+    @classmethod
+    def get_page(cls, target, page=1):
+        """
+        返回(评论列表, 是否还有下一页)，评论按时间倒序，每页COMMENT_PAGE_SIZE条。
+        每页的结果缓存在共享缓存中，键包含该目标的世代号，评论变化时由信号调用invalidate()使其全部失效
+        """
+        size = settings.COMMENT_PAGE_SIZE
+        key = 'comments:%s:%s:%s' % (cls._cache_name(target), cls._generation(target).get(), page)
+        result = cache.get(key)
+        if result is None:
+            offset = (page - 1) * size
+            rows = list(cls.get_by_target(target).values(
+                'id', 'nickname', 'website', 'content', 'created_time')[offset:offset + size + 1])
+            result = rows[:size], len(rows) > size
+            cache.set(key, result, settings.COMMENT_CACHE_TIMEOUT)
+        return result
+
+    @classmethod
+    def invalidate(cls, target):
+        cls._generation(target).bump()
+
+    @classmethod
+    def _generation(cls, target):
+        return CacheGeneration('comments:generation:%s' % cls._cache_name(target))
+
+    @classmethod
+    def _cache_name(cls, target):
+        """ 评论目标由用户提交，不直接用作缓存键 """
+        post_id = cls.post_id_of(target)
+        if post_id is not None:
+            return 'post:%s' % post_id
+        return hashlib.md5(target.encode('utf-8')).hexdigest()
 
     class Meta:
         verbose_name = verbose_name_plural = '评论'
+        indexes = [
+            models.Index(fields=['post', 'status', '-id'], name='comment_post_status_id'),
+            models.Index(fields=['target', 'status'], name='comment_target_status'),  # 非文章页面的评论
+            models.Index(fields=['status', 'id'], name='comment_status_id'),  # 最近评论
+        ]
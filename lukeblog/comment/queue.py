@@ -0,0 +1,183 @@
+"""
+评论提交队列：提交的评论先以JSON文件的形式写入本地目录（durable），立即返回；
+由后台线程（或process_comment_queue命令）批量做垃圾评论检查，通过的评论用一条bulk_create写入数据库，状态为未审核
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LINK_RE = re.compile(r'https?://|www\.', re.IGNORECASE)
+
+
+class CommentQueue:
+    """
+    目录结构：new/中为待处理的评论，processing/中为正在处理的评论。
+    消费者先把文件改名移入processing/（改名是原子的，多个消费者不会重复处理同一条），写入数据库后删除；
+    写入失败或进程中途退出时，文件会被移回new/等待下一次处理
+    """
+    def __init__(self, root, batch_size, interval):
+        self.root = root
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def put(self, data):
+        """ 写入一条评论（dict），写入磁盘后才返回 """
+        new_dir = self._dir('new')
+        name = '%020d-%s.json' % (time.time_ns(), uuid.uuid4().hex)
+        temp_path = os.path.join(self._dir('tmp'), name)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, os.path.join(new_dir, name))  # 消费者只会看到完整的文件
+        if settings.COMMENT_QUEUE_CONSUMER:
+            self._schedule()
+
+    def process(self, limit=None):
+        """ 处理队列中的评论，返回(写入数, 丢弃数)；写入数据库失败时评论放回队列并抛出DatabaseError """
+        self.recover()
+        accepted = rejected = 0
+        while limit is None or accepted + rejected < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - accepted - rejected)
+            batch = self._claim(size)
+            if not batch:
+                break
+            written, dropped = self._write(batch)
+            accepted += written
+            rejected += dropped
+        return accepted, rejected
+
+    def recover(self, older_than=None):
+        """ 将processing/中滞留的文件（消费者中途退出）移回new/ """
+        older_than = settings.COMMENT_QUEUE_STALE_SECONDS if older_than is None else older_than
+        processing_dir = self._dir('processing')
+        for name in os.listdir(processing_dir):
+            path = os.path.join(processing_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) >= older_than:
+                    os.replace(path, os.path.join(self._dir('new'), name))
+            except FileNotFoundError:  # 已被其他消费者处理
+                pass
+
+    def pending(self):
+        return len(os.listdir(self._dir('new')))
+
+    def _claim(self, size):
+        """ 按提交顺序取出最多size条，返回[(processing中的路径, 评论数据), ...] """
+        new_dir, processing_dir = self._dir('new'), self._dir('processing')
+        batch = []
+        for name in sorted(os.listdir(new_dir)):
+            if len(batch) >= size:
+                break
+            path = os.path.join(processing_dir, name)
+            try:
+                os.replace(os.path.join(new_dir, name), path)
+            except FileNotFoundError:  # 被其他消费者取走了
+                continue
+            os.utime(path)  # 以取出的时间判断是否滞留
+            try:
+                with open(path, encoding='utf-8') as f:
+                    batch.append((path, json.load(f)))
+            except ValueError:
+                logger.error('invalid comment in queue: %s', path)
+                os.remove(path)
+        return batch
+
+    def _write(self, batch):
+        from .models import Comment  # 避免循环引用
+
+        comments = []
+        for path, data in batch:
+            if not self.is_spam(data):
+                comments.append(Comment(
+                    target=data['target'], nickname=data['nickname'], email=data['email'],
+                    website=data['website'], content=data['content'], status=Comment.STATUS_UNAUDITED,
+                ))
+        comments = self._dedupe(comments)
+        Comment.fill_posts(comments)
+        try:
+            Comment.objects.bulk_create(comments)
+        except DatabaseError:
+            # 放回队列，等待下一次处理
+            for path, data in batch:
+                os.replace(path, os.path.join(self._dir('new'), os.path.basename(path)))
+            raise
+        for path, data in batch:
+            os.remove(path)
+        return len(comments), len(batch) - len(comments)
+
+    @staticmethod
+    def is_spam(data):
+        """ 链接过多或包含屏蔽词的评论视为垃圾评论 """
+        content = data['content']
+        if len(LINK_RE.findall(content)) > settings.COMMENT_MAX_LINKS:
+            return True
+        text = ' '.join((content, data['nickname'], data['website'])).lower()
+        return any(word.lower() in text for word in settings.COMMENT_SPAM_WORDS)
+
+    @staticmethod
+    def _dedupe(comments):
+        """
+        同一作者（昵称、邮箱）对同一目标的相同内容只保留一条：同一批中重复的，或COMMENT_DEDUPE_SECONDS秒内已写入数据库的，
+        即只拦截重复提交；不同读者的相同回复（如“谢谢分享”）、或隔一段时间后的相同内容不受影响。用一次查询检查
+        """
+        from .models import Comment
+
+        def key(comment):
+            return comment.target, comment.nickname, comment.email, comment.content
+
+        if not comments:
+            return []
+        since = timezone.now() - timedelta(seconds=settings.COMMENT_DEDUPE_SECONDS)
+        seen = set(Comment.objects.filter(
+            target__in={comment.target for comment in comments},
+            content__in={comment.content for comment in comments},
+            created_time__gte=since,
+        ).values_list('target', 'nickname', 'email', 'content'))
+        result = []
+        for comment in comments:
+            if key(comment) not in seen:
+                seen.add(key(comment))
+                result.append(comment)
+        return result
+
+    def _dir(self, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _schedule(self):
+        """ 与pv/uv计数的写回相同：启动一个定时器，interval秒内提交的评论一起处理 """
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.interval, self._timer_process)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timer_process(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.process()
+        except Exception:
+            logger.exception('process comment queue failed')
+        finally:
+            connections.close_all()  # 定时器线程中打开的数据库连接需要手动关闭
+
+
+comment_queue = CommentQueue(
+    settings.COMMENT_QUEUE_DIR, settings.COMMENT_QUEUE_BATCH_SIZE, settings.COMMENT_QUEUE_INTERVAL)
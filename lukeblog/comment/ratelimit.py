@@ -0,0 +1,28 @@
+""" 评论提交的限流：按IP、按uid各一个令牌桶，状态保存在共享缓存中 """
+import time
+
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """
+    桶中最多capacity个令牌，每秒补充rate个，每次提交消耗一个，桶空时拒绝。
+    读-改-写不是原子的，并发提交时可能多放行少量请求，对限流来说可以接受
+    """
+    def __init__(self, prefix, capacity, rate):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.rate = rate
+
+    def consume(self, key):
+        """ 消耗一个令牌，返回是否允许 """
+        cache_key = '%s:%s' % (self.prefix, key)
+        now = time.time()
+        tokens, updated = cache.get(cache_key) or (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # 桶补满所需的时间之后，缓存中的状态与新桶相同，可以过期
+        cache.set(cache_key, (tokens, now), int((self.capacity - tokens) / self.rate) + 1)
+        return allowed
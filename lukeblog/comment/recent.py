@@ -0,0 +1,86 @@
+""" 最近评论：共享缓存中只保存最新的size条已审核的文章评论（已带上文章标题和链接），供“最近评论”侧边栏使用 """
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+RECENT_KEY = 'recent_comments'
+
+
+class RecentComments:
+    """
+    列表按评论id从新到旧排列，长度不超过size；评论审核通过、修改、删除时由信号增量更新，
+    只有列表中的评论被移除（不够size条）或缓存丢失时才从数据库查询最新的size条补足。
+    读-改-写不是原子的，并发修改时可能丢失一次更新，由下一次重建纠正
+    """
+    def __init__(self, size):
+        self.size = size
+
+    def get(self):
+        """ 返回[{'id', 'title', 'url', 'nickname', 'content', 'created_time'}, ...] """
+        items = cache.get(RECENT_KEY)
+        if items is None:
+            items = self.rebuild()
+        return items
+
+    def update(self, comment):
+        """ 评论保存后调用：已审核的文章评论加入列表（或更新），其他状态从列表中移除 """
+        items = cache.get(RECENT_KEY)
+        if items is None:
+            return  # 下次读取时重建
+        rest = [item for item in items if item['id'] != comment.id]
+        if not self.is_visible(comment):
+            if len(rest) != len(items):
+                self.rebuild()  # 移除后不够size条，需要从数据库补足
+            return
+        if len(rest) == len(items) and len(items) >= self.size and comment.id < items[-1]['id']:
+            return  # 比列表中最旧的还旧
+        rest.append(self.to_item(comment))
+        rest.sort(key=lambda item: item['id'], reverse=True)
+        cache.set(RECENT_KEY, rest[:self.size], None)
+
+    def remove(self, comment_id):
+        items = cache.get(RECENT_KEY)
+        if items is not None and any(item['id'] == comment_id for item in items):
+            self.rebuild()
+
+    def refresh_post(self, post_id):
+        """ 文章改名、下线或删除后，列表中有它的评论时重建 """
+        items = cache.get(RECENT_KEY)
+        if items is not None and any(item['post_id'] == post_id for item in items):
+            self.rebuild()
+
+    def rebuild(self):
+        from blog.models import Post
+        from .models import Comment
+
+        comments = Comment.objects.filter(
+            status=Comment.STATUS_NORMAL, post__status=Post.STATUS_NORMAL,
+        ).select_related('post').only(
+            'id', 'post_id', 'post__title', 'nickname', 'content', 'created_time',
+        ).order_by('-id')[:self.size]
+        items = [self.to_item(comment) for comment in comments]
+        cache.set(RECENT_KEY, items, None)
+        return items
+
+    @staticmethod
+    def is_visible(comment):
+        from blog.models import Post
+        from .models import Comment
+
+        return (comment.status == Comment.STATUS_NORMAL and comment.post_id is not None
+                and comment.post.status == Post.STATUS_NORMAL)
+
+    @staticmethod
+    def to_item(comment):
+        return {
+            'id': comment.id,
+            'post_id': comment.post_id,
+            'title': comment.post.title,
+            'url': reverse('post-detail', args=[comment.post_id]),
+            'nickname': comment.nickname,
+            'content': comment.content,
+            'created_time': comment.created_time,
+        }
+
+
+recent_comments = RecentComments(settings.RECENT_COMMENTS_SIZE)
@@ -8,9 +8,11 @@ register = template.Library()
 
 @register.inclusion_tag('comment/block.html')  # 注册器传入评论标签所用的模板
 def comment_block(target):
+    comment_list, has_next = Comment.get_page(target)  # 只取第一页（已缓存），之后的评论由页面中的“加载更多”按需请求
     return {
         # 以下是要传给block.html的上下文
         'target': target,  # 由于是自定义标签，没有request对象，需要将target值传递给模板
         'comment_form': CommentForm(),  # 评论表单
-        'comment_list': Comment.get_by_target(target),  # 在Model中定义的classmethod，通过评论目标获取评论列表
+        'comment_list': comment_list,
+        'next_page': 2 if has_next else None,
     }
@@ -1,3 +1,114 @@
-from django.test import TestCase
+import os
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import override_settings
+from django.utils import timezone
+
+from blog.tests import IsolatedTestCase
+from .models import Comment
+from .queue import CommentQueue
+from .ratelimit import TokenBucket
+
+
+class CommentQueueTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = self.create_post()
+        self.target = '/post/%s.html' % self.post.id
+        self.queue = CommentQueue(os.path.join(self.root, 'queue'), batch_size=2, interval=60)
+
+    def comment(self, content='写得很好', nickname='读者', email='reader@example.com', **kwargs):
+        return dict({'target': self.target, 'nickname': nickname, 'email': email,
+                     'website': 'https://example.com', 'content': content}, **kwargs)
+
+    def test_process_in_batches(self):
+        for i in range(5):
+            self.queue.put(self.comment('评论%d' % i))
+        self.assertEqual(self.queue.pending(), 5)
+        self.assertEqual(self.queue.process(limit=3), (3, 0))
+        self.assertEqual(self.queue.pending(), 2)
+        self.assertEqual(self.queue.process(), (2, 0))
+        self.assertEqual(self.queue.pending(), 0)
+        comments = Comment.objects.order_by('id')
+        self.assertEqual([comment.content for comment in comments], ['评论%d' % i for i in range(5)])  # 保持提交顺序
+        self.assertTrue(all(comment.status == Comment.STATUS_UNAUDITED for comment in comments))
+        self.assertTrue(all(comment.post_id == self.post.id for comment in comments))
+
+    def test_claim_and_recover(self):
+        """ 取出后没有处理完的评论，超过滞留时间后由recover移回new/ """
+        self.queue.put(self.comment('评论1'))
+        self.queue.put(self.comment('评论2'))
+        batch = self.queue._claim(1)
+        self.assertEqual([data['content'] for path, data in batch], ['评论1'])
+        self.assertEqual(self.queue.pending(), 1)
+        self.assertEqual(self.queue._claim(5)[0][1]['content'], '评论2')  # 已取出的不会被再次取出
+        self.assertEqual(self.queue._claim(5), [])
+
+        self.queue.recover()  # 还没有超过COMMENT_QUEUE_STALE_SECONDS
+        self.assertEqual(self.queue.pending(), 0)
+        self.queue.recover(older_than=0)
+        self.assertEqual(self.queue.pending(), 2)
+        self.assertEqual(self.queue.process(), (2, 0))
+
+    def test_database_error_puts_batch_back(self):
+        from django.db import DatabaseError
+
+        self.queue.put(self.comment())
+        with mock.patch.object(Comment.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.queue.process()
+        self.assertEqual(self.queue.pending(), 1)
+        self.assertEqual(self.queue.process(), (1, 0))
+
+    @override_settings(COMMENT_SPAM_WORDS=['casino'], COMMENT_MAX_LINKS=1)
+    def test_spam(self):
+        self.queue.put(self.comment('online CASINO'))
+        self.queue.put(self.comment('http://a.com http://b.com'))
+        self.queue.put(self.comment('正常的评论'))
+        self.assertEqual(self.queue.process(), (1, 2))
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)), ['正常的评论'])
+
+    def test_dedupe_resubmits(self):
+        """ 同一作者的重复提交（同一批中或刚写入的）只保留一条 """
+        self.queue.put(self.comment())
+        self.queue.put(self.comment())
+        self.assertEqual(self.queue.process(), (1, 1))
+        self.queue.put(self.comment())
+        self.assertEqual(self.queue.process(), (0, 1))
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_dedupe_keeps_common_replies(self):
+        """ 不同读者的相同回复、同一读者隔一段时间后的相同内容都不是重复提交 """
+        self.queue.put(self.comment('谢谢分享'))
+        self.queue.put(self.comment('谢谢分享', nickname='另一位读者', email='other@example.com'))
+        self.assertEqual(self.queue.process(), (2, 0))
+
+        Comment.objects.update(created_time=timezone.now() - timedelta(days=1))
+        self.queue.put(self.comment('谢谢分享'))
+        self.assertEqual(self.queue.process(), (1, 0))
+        self.assertEqual(Comment.objects.filter(content='谢谢分享').count(), 3)
+
+
+class TokenBucketTests(IsolatedTestCase):
+    def test_consume(self):
+        bucket = TokenBucket('test_rate', capacity=3, rate=1)
+        with mock.patch('comment.ratelimit.time.time', return_value=1000.0) as now:
+            self.assertEqual([bucket.consume('a') for i in range(4)], [True, True, True, False])
+            self.assertTrue(bucket.consume('b'))  # 各个key独立
+            now.return_value = 1001.5  # 1.5秒补充1.5个令牌
+            self.assertEqual([bucket.consume('a') for i in range(2)], [True, False])
+            now.return_value = 2000.0  # 不会超过capacity
+            self.assertEqual([bucket.consume('a') for i in range(4)], [True, True, True, False])
+
+
+class CommentViewTests(IsolatedTestCase):
+    def test_rate_limit(self):
+        post = self.create_post()
+        data = {'target': '/post/%s.html' % post.id, 'nickname': '读者', 'email': 'reader@example.com',
+                'website': 'https://example.com'}
+        statuses = [
+            self.client.post('/comment/', dict(data, content='第%d条评论' % i)).status_code
+            for i in range(6)
+        ]
+        self.assertEqual(statuses, [200] * 5 + [429])
@@ -1,25 +1,37 @@
-from django.shortcuts import redirect  # 重定向模块
+from django.conf import settings
+from django.http import Http404
 from django.views.generic import TemplateView
 
 from .forms import CommentForm
+from .models import Comment
+from .queue import comment_queue
+from .ratelimit import TokenBucket
 
 
 class CommentView(TemplateView):
     """ 评论表单的action功能页面 """
     http_method_names = ['post']  # 此View只处理POST请求
     template_name = 'comment/result.html'  # 返回结果页的模板
+    ip_bucket = TokenBucket('comment_rate:ip', settings.COMMENT_RATE_BURST, settings.COMMENT_RATE_PER_MINUTE / 60)
+    uid_bucket = TokenBucket('comment_rate:uid', settings.COMMENT_RATE_BURST, settings.COMMENT_RATE_PER_MINUTE / 60)
 
     def post(self, request, *args, **kwargs):
-        """ 重写POST请求逻辑 """
+        """ 重写POST请求逻辑：校验通过的评论放入队列后立即返回，由后台批量检查、写入数据库 """
         comment_form = CommentForm(request.POST)  # 根据forms.py中定义的用户输入表单，取出POST提交表单中用户输入的数据
         target = request.POST.get('target')  # 取出表单中隐藏的target值
 
-        if comment_form.is_valid():  # 如果数据有效
-            instance = comment_form.save(commit=False)  # 保存表单为一个实例，但不提交到数据库，默认为True
-            instance.target = target  # 添加上述表单实例属性target（值为之前取回的来自页面POST的值）
-            instance.save()  # 保存表单并提交到数据库
+        # 两个桶都要消耗令牌，同一IP下换uid、同一uid换IP都会被限制
+        allowed = self.ip_bucket.consume(request.META.get('REMOTE_ADDR'))
+        allowed = self.uid_bucket.consume(request.uid) and allowed
+        if not allowed:
+            context = {'succeed': False, 'limited': True, 'target': target}
+            return self.render_to_response(context, status=429)
+
+        max_length = Comment._meta.get_field('target').max_length
+        if comment_form.is_valid() and target and len(target) <= max_length:  # 如果数据有效
+            data = dict(comment_form.cleaned_data, target=target)
+            comment_queue.put(data)  # 写入本地队列，不直接访问数据库
             succeed = True
-            # return redirect(target)  # 重定向到表单提交页面，如果没有这句，将往下执行，返回提交成功的提示
         else:
             succeed = False
 
@@ -29,3 +41,26 @@ class CommentView(TemplateView):
             'target': target,
         }
         return self.render_to_response(context)
+
+
+class CommentListView(TemplateView):
+    """ 评论的“加载更多”：返回某个评论目标第page页评论的HTML片段，由详情页中的脚本追加到评论列表中 """
+    http_method_names = ['get']
+    template_name = 'comment/list.html'
+
+    def get_context_data(self, **kwargs):
+        target = self.request.GET.get('target', '')
+        try:
+            page = int(self.request.GET.get('page', 1))
+        except ValueError:
+            raise Http404('页码无效')
+        if not target or page < 1:
+            raise Http404('页码无效')
+        comment_list, has_next = Comment.get_page(target, page)
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'target': target,
+            'comment_list': comment_list,
+            'next_page': page + 1 if has_next else None,
+        })
+        return context
@@ -0,0 +1,72 @@
+import glob
+import os
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import Post
+from config.models import MediaBlob, SideBar
+from lukeblog.storage import BLOB_DIR
+
+DIGEST_RE = re.compile(BLOB_DIR + r'/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})')
+
+
+class Command(BaseCommand):
+    help = '删除没有被文章、侧边栏引用的媒体文件（包括派生图），上传后宽限期内的文件保留，以免删掉正在编辑、尚未保存的文章中的图片'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24, help='宽限期（小时），默认24')
+        parser.add_argument('--dry-run', action='store_true', help='只列出将被删除的文件')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        referenced = self.referenced_digests()
+
+        removed = 0
+        for blob in MediaBlob.objects.filter(created_time__lt=cutoff).iterator():
+            if blob.digest in referenced:
+                continue
+            removed += self.remove_files(blob.digest, os.path.dirname(os.path.join(settings.MEDIA_ROOT, blob.name)))
+            if not self.dry_run:
+                blob.delete()  # 同时删除它的上传记录（MediaReference）
+
+        # 磁盘上没有数据库记录的文件（如写入后数据库事务回滚）
+        known = set(MediaBlob.objects.values_list('digest', flat=True))
+        for dirpath, dirnames, filenames in os.walk(os.path.join(settings.MEDIA_ROOT, BLOB_DIR)):
+            for filename in filenames:
+                digest = filename[:64]
+                path = os.path.join(dirpath, filename)
+                if digest in known or digest in referenced:
+                    continue
+                if datetime.fromtimestamp(os.path.getmtime(path), timezone.utc) < cutoff:
+                    removed += self.remove_path(path)
+
+        action = '将删除' if self.dry_run else '已删除'
+        self.stdout.write(self.style.SUCCESS('%s%d个文件，仍被引用的媒体文件%d个' % (action, removed, len(referenced))))
+
+    @staticmethod
+    def referenced_digests():
+        """ 文章（包括草稿）正文和HTML侧边栏中出现的媒体文件摘要（派生图的URL中也含有原图的摘要） """
+        digests = set()
+        for texts in Post.objects.values_list('content', 'content_html').iterator():
+            for text in texts:
+                digests.update(DIGEST_RE.findall(text))
+        for content in SideBar.objects.values_list('content', flat=True):
+            digests.update(DIGEST_RE.findall(content))
+        return digests
+
+    def remove_files(self, digest, directory):
+        """ 删除原图及其派生图，返回文件数 """
+        paths = glob.glob(os.path.join(directory, digest + '.*'))
+        paths += glob.glob(os.path.join(directory, digest + '-*w.*'))
+        return sum(self.remove_path(path) for path in paths)
+
+    def remove_path(self, path):
+        self.stdout.write(path)
+        if not self.dry_run:
+            os.remove(path)
+        return 1
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0002_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['status'], name='link_status'),
+        ),
+        migrations.AddIndex(
+            model_name='sidebar',
+            index=models.Index(fields=['status'], name='sidebar_status'),
+        ),
+    ]
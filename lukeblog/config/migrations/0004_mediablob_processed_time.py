@@ -0,0 +1,26 @@
+# Generated by Django 3.0.14 on 2026-10-18 11:18
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_processed(apps, schema_editor):
+    """ 已有的文件无法区分是否加过水印，视为已处理完成，避免重复加水印 """
+    MediaBlob = apps.get_model('config', 'MediaBlob')
+    MediaBlob.objects.update(processed_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='processed_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='处理完成时间'),
+        ),
+        migrations.RunPython(mark_existing_processed, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
 from django.db import models
 from django.template.loader import render_to_string  # 传入(模板, 字典)渲染成HTML
+from django.utils import timezone
 
 
 class Link(models.Model):
@@ -21,6 +24,9 @@ class Link(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = '友链'
+        indexes = [
+            models.Index(fields=['status'], name='link_status'),
+        ]
 
 
 class SideBar(models.Model):
@@ -55,7 +61,7 @@ class SideBar(models.Model):
         """ 直接渲染成HTML """
         # 注意：在Model中引入其他Model时，在方法内部引入，可避免循环引用
         from blog.models import Post
-        from comment.models import Comment
+        from comment.recent import recent_comments
 
         result = ''  # 用来返回的HTML结果
         if self.display_type == self.DISPLAY_HTML:
@@ -72,7 +78,7 @@ class SideBar(models.Model):
             result = render_to_string('config/blocks/sidebar_posts.html', context)
         elif self.display_type == self.DISPLAY_COMMENT:
             context = {
-                'comments': Comment.objects.filter(status=Comment.STATUS_NORMAL)
+                'comments': recent_comments.get()  # 缓存中最新的几条评论，不查询数据库
             }
             result = render_to_string('config/blocks/sidebar_comments.html', context)
         return result
@@ -85,3 +91,45 @@ class SideBar(models.Model):
 
     class Meta:
         verbose_name = verbose_name_plural = '侧边栏'
+        indexes = [
+            models.Index(fields=['status'], name='sidebar_status'),
+        ]
+
+
+class MediaBlob(models.Model):
+    """ 按内容寻址的媒体文件：同样内容的上传只保存一份，路径由内容的SHA-256摘要决定 """
+    digest = models.CharField(max_length=64, unique=True, verbose_name="内容摘要")
+    name = models.CharField(max_length=255, verbose_name="存储路径")
+    size = models.PositiveIntegerField(verbose_name="大小")
+    # 图片在后台加水印等处理完成的时间，为空表示还未处理完（处理任务只在内存中，进程重启会丢失）；其他文件保存时即为处理完成
+    processed_time = models.DateTimeField(null=True, blank=True, verbose_name="处理完成时间")
+    created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def mark_processed(cls, blob_id):
+        cls.objects.filter(pk=blob_id).update(processed_time=timezone.now())
+
+    @classmethod
+    def get_pending(cls, older_than):
+        """ 上传超过older_than秒仍未处理完成的媒体文件，即处理任务已经丢失的 """
+        return cls.objects.filter(processed_time__isnull=True,
+                                  created_time__lt=timezone.now() - timedelta(seconds=older_than))
+
+    class Meta:
+        verbose_name = verbose_name_plural = '媒体文件'
+
+
+class MediaReference(models.Model):
+    """ 每次上传的原始文件名与实际保存的媒体文件的对应关系 """
+    name = models.CharField(max_length=255, verbose_name="上传文件名")
+    blob = models.ForeignKey(MediaBlob, on_delete=models.CASCADE, related_name='references', verbose_name="媒体文件")
+    created_time = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = verbose_name_plural = '媒体文件引用'
@@ -1,3 +1,95 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from blog.tests import IsolatedTestCase
+from .models import MediaBlob
+
+
+def image_file(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class BrowseMediaTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def test_ckeditor_browse_url(self):
+        """ 编辑器中“浏览服务器”的链接由这里的视图处理 """
+        self.assertEqual(resolve(reverse('ckeditor_browse')).url_name, 'media-browse')
+
+    def test_lists_uploads_by_reference(self):
+        """ 上传的文件保存在blobs/下，浏览时按上传的文件名列出，同样内容只列一次 """
+        first = default_storage.save('article_images/2020/01/01/notes.txt', ContentFile(b'notes'))
+        default_storage.save('article_images/2020/01/02/copy.txt', ContentFile(b'notes'))
+        other = default_storage.save('article_images/2020/01/03/other.txt', ContentFile(b'other'))
+        default_storage.save('elsewhere/hidden.txt', ContentFile(b'hidden'))
+        self.assertTrue(first.startswith('blobs/'))
+
+        self.assertEqual(self.client.get('/ckeditor/browse/').status_code, 302)  # 需要登录后台
+        self.client.force_login(self.user)
+        response = self.client.get('/ckeditor/browse/')
+        self.assertEqual(response.status_code, 200)
+        files = response.context['files']
+        self.assertEqual([item['visible_filename'] for item in files], ['other.txt', 'copy.txt'])
+        self.assertEqual([item['src'] for item in files], [default_storage.url(other), default_storage.url(first)])
+
+        response = self.client.post('/ckeditor/browse/', {'q': 'OTHER'})
+        self.assertEqual([item['visible_filename'] for item in response.context['files']], ['other.txt'])
+
+
+@mock.patch('lukeblog.imaging.submit')
+class MediaProcessingTests(IsolatedTestCase):
+    def test_record_processing(self, submit):
+        """ 其他文件保存时即为处理完成，图片在后台处理完成后才记录 """
+        default_storage.save('article_images/notes.txt', ContentFile(b'notes'))
+        self.assertIsNotNone(MediaBlob.objects.get(name__endswith='.txt').processed_time)
+
+        name = default_storage.save('article_images/photo.png', image_file())
+        blob = MediaBlob.objects.get(name=name)
+        self.assertIsNone(blob.processed_time)
+        submit.assert_called_once_with(default_storage.path(name), blob.pk)
+
+        from lukeblog.imaging import process_blob
+        self.assertTrue(process_blob(*submit.call_args[0]))
+        blob.refresh_from_db()
+        self.assertIsNotNone(blob.processed_time)
+
+    def test_backfill_pending(self, submit):
+        """ 进程重启丢失的处理任务由backfill_images --pending补做，刚上传的可能还在处理中，不重复处理 """
+        lost = default_storage.save('article_images/lost.png', image_file('red'))
+        recent = default_storage.save('article_images/recent.png', image_file('blue'))
+        MediaBlob.objects.filter(name=lost).update(created_time=timezone.now() - timedelta(days=1))
+        call_command('backfill_images', '--pending', stdout=io.StringIO())
+        self.assertIsNotNone(MediaBlob.objects.get(name=lost).processed_time)
+        self.assertIsNone(MediaBlob.objects.get(name=recent).processed_time)
+
+    def test_immutable_after_processing(self, submit):
+        """ 只有处理完成的图片（及其派生图）才允许永久缓存，处理任务丢失的图片不论上传了多久都要重新验证 """
+        from lukeblog import media
+
+        media._processed_digests.clear()
+        self.addCleanup(media._processed_digests.clear)
+        name = default_storage.save('article_images/photo.png', image_file('green'))
+        MediaBlob.objects.filter(name=name).update(created_time=timezone.now() - timedelta(days=1))
+        response = self.client.get(default_storage.url(name))
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        from lukeblog.imaging import derivative_path, process_blob
+        process_blob(*submit.call_args[0])
+        self.assertEqual(self.client.get(default_storage.url(name))['Cache-Control'], media.IMMUTABLE_CACHE_CONTROL)
+        response = self.client.get(default_storage.url(derivative_path(name, 320)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], media.IMMUTABLE_CACHE_CONTROL)
@@ -1,6 +1,7 @@
 from dal import autocomplete
 
 from blog.models import Category, Tag
+from blog.suggest import suggest_index
 
 
 class CategoryAutocomplete(autocomplete.Select2QuerySetView):
@@ -11,8 +12,8 @@ class CategoryAutocomplete(autocomplete.Select2QuerySetView):
 
         qs = Category.objects.filter(owner=self.request.user)  # 先取得当前用户下的所有分类
 
-        if self.q:  # q为URL传来的参数
-            qs = qs.filter(name__istartswith=self.q)
+        if self.q:  # q为URL传来的参数，前缀匹配由内存中的有序数组完成，不再用 LIKE 'q%' 扫描分类表
+            qs = qs.filter(pk__in=suggest_index.match_ids('category', self.q))
         return qs
 
 
@@ -25,5 +26,5 @@ class TagAutocomplete(autocomplete.Select2QuerySetView):
         qs = Tag.objects.filter(owner=self.request.user)
 
         if self.q:
-            qs = qs.filter(name__istartswith=self.q)
+            qs = qs.filter(pk__in=suggest_index.match_ids('tag', self.q))
         return qs
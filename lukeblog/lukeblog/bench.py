@@ -0,0 +1,218 @@
+"""
+性能测试的公共部分（benchmark、loadtest命令使用）：建立独立的测试数据库并填充指定数量的数据，
+隔离缓存和预生成文件，统计耗时的分位数和查询数
+"""
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+WORDS = ('django', 'python', 'cache', 'index', 'query', 'sqlite', 'feed', 'sitemap', 'comment', 'image',
+         '性能', '缓存', '索引', '查询', '数据库', '博客', '评论', '分页')
+
+
+def percentile(values, q):
+    """ 线性插值的分位数，q为0~100 """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(durations):
+    """ 耗时（秒）的统计，单位为毫秒 """
+    return {
+        'count': len(durations),
+        'mean': round(sum(durations) / len(durations) * 1000, 3) if durations else 0.0,
+        'p50': round(percentile(durations, 50) * 1000, 3),
+        'p95': round(percentile(durations, 95) * 1000, 3),
+        'p99': round(percentile(durations, 99) * 1000, 3),
+        'max': round(max(durations) * 1000, 3) if durations else 0.0,
+    }
+
+
+class QueryCounter:
+    """ 用execute_wrapper统计查询数和耗时（只统计当前线程的连接） """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def measure(func, iterations, warmup=0, before=None):
+    """ 调用func iterations次，返回(每次的耗时列表, 每次的查询数列表)；before在每次调用前执行，不计入耗时 """
+    for i in range(warmup):
+        if before:
+            before()
+        func()
+    durations, queries = [], []
+    for i in range(iterations):
+        if before:
+            before()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    return durations, queries
+
+
+@contextmanager
+def test_database(keepdb=False, name=None):
+    """
+    建立并切换到测试数据库（按DATABASES中TEST的配置，SQLite默认在内存中），退出时删除；
+    name指定测试数据库名（SQLite为文件路径），多个线程需要共享同一个数据库时使用
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name:
+        test_settings['NAME'] = name
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+    finally:
+        test_settings['NAME'] = old_test_name
+
+
+@contextmanager
+def isolated_environment():
+    """
+    使用独立的本地内存缓存、临时目录中的预生成文件（站点地图、RSS、搜索索引、上传文件、评论队列），
+    不影响正在运行的站点；各模块的单例在导入时读取了设置，这里直接替换它们的路径并清空进程内副本
+    """
+    from blog.chrome import chrome
+    from blog.rss import feed_builder
+    from blog.search import search_index
+    from blog.sitemap import sitemap_builder
+    from blog.suggest import suggest_index
+    from comment.queue import comment_queue
+
+    root = tempfile.mkdtemp(prefix='lukeblog-bench-')
+    paths = [
+        (sitemap_builder, 'root', os.path.join(root, 'sitemaps')),
+        (feed_builder, 'root', os.path.join(root, 'feeds')),
+        (search_index, 'path', os.path.join(root, 'search_index.pickle')),
+        (comment_queue, 'root', os.path.join(root, 'comment_queue')),
+    ]
+    search_index.flush()  # 尚未写入的修改先写到原来的文件
+    saved = [(obj, attr, getattr(obj, attr)) for obj, attr, path in paths]
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': root}}
+    try:
+        for obj, attr, path in paths:
+            setattr(obj, attr, path)
+        search_index._mtime = None
+        with override_settings(CACHES=caches, MEDIA_ROOT=os.path.join(root, 'media'), ALLOWED_HOSTS=['*'],
+                               DEBUG=False, COMMENT_QUEUE_CONSUMER=False):
+            chrome._local = None
+            suggest_index._local_generation = None
+            yield root
+    finally:
+        search_index.flush()
+        for obj, attr, value in saved:
+            setattr(obj, attr, value)
+        search_index._mtime = None
+        chrome._local = None
+        suggest_index._local_generation = None
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def seed(posts=1000, categories=10, tags=50, comments=5000, sidebars=4, seed_value=0):
+    """
+    填充测试数据：用bulk_create批量写入（不触发信号），之后一次性生成标签冗余字段、搜索索引、站点地图和RSS；
+    comments条评论随机分布在各篇文章下，另外为一篇已发布的文章（comment_post_id）生成3页评论，用于测量评论翻页；
+    返回{'user', 'post_ids'（已发布的文章）, 'comment_post_id', 'category_ids', 'tag_ids'}
+    """
+
+    from blog.models import Category, Post, Tag
+    from blog.rss import feed_builder
+    from blog.search import search_index
+    from blog.sitemap import sitemap_builder
+    from comment.models import Comment
+    from config.models import Link, SideBar
+
+    rng = random.Random(seed_value)
+    user = User.objects.create_user('bench', 'bench@example.com', 'bench')
+    Category.objects.bulk_create([
+        Category(name='分类%d' % i, is_nav=i < 3, owner=user) for i in range(categories)])
+    Tag.objects.bulk_create([Tag(name='标签%d' % i, owner=user) for i in range(tags)])
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+    now = timezone.now()
+    batch = []
+    for i in range(posts):
+        words = ' '.join(rng.choice(WORDS) for _ in range(200))
+        batch.append(Post(
+            title='文章%d %s %s' % (i, rng.choice(WORDS), rng.choice(WORDS)), desc=words[:100],
+            content=words, content_html='<p>%s</p>' % words,
+            status=Post.STATUS_DRAFT if i % 20 == 19 else Post.STATUS_NORMAL,
+            category_id=rng.choice(category_ids), owner=user, pv=rng.randint(1, 10000), uv=rng.randint(1, 1000),
+            created_time=now, updated_time=now,
+        ))
+    Post.objects.bulk_create(batch)
+    post_ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+    published_ids = list(Post.objects.filter(status=Post.STATUS_NORMAL).order_by('id').values_list('id', flat=True))
+    comment_post_id = published_ids[len(published_ids) // 2]
+
+    through = Post.tag.through
+    through.objects.bulk_create([
+        through(post_id=post_id, tag_id=tag_id)
+        for post_id in post_ids for tag_id in rng.sample(tag_ids, min(3, len(tag_ids)))
+    ])
+    Post.sync_tag_items(post_ids)
+
+    comment_posts = [rng.choice(post_ids) for _ in range(comments)] + [comment_post_id] * settings.COMMENT_PAGE_SIZE * 3
+    Comment.objects.bulk_create([
+        Comment(target='/post/%s.html' % post_id, post_id=post_id, content='评论%d %s' % (i, rng.choice(WORDS)),
+                nickname='访客%d' % (i % 100), website='https://example.com', email='guest@example.com',
+                status=Comment.STATUS_NORMAL)
+        for i, post_id in enumerate(comment_posts)
+    ])
+    display_types = [SideBar.DISPLAY_HTML, SideBar.DISPLAY_LATEST, SideBar.DISPLAY_HOT, SideBar.DISPLAY_COMMENT]
+    SideBar.objects.bulk_create([
+        SideBar(title='侧边栏%d' % i, display_type=display_types[i % 4], content='<p>html</p>', owner=user)
+        for i in range(sidebars)])
+    Link.objects.bulk_create([Link(title='友链%d' % i, href='https://example.com/%d' % i, owner=user) for i in range(10)])
+
+    search_index.rebuild()
+    sitemap_builder.build_all()
+    feed_builder.build_all()
+    return {'user': user, 'post_ids': published_ids, 'comment_post_id': comment_post_id,
+            'category_ids': category_ids, 'tag_ids': tag_ids}
+
+
+def load_json(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
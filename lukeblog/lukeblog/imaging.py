@@ -0,0 +1,219 @@
+""" 上传图片的后台处理：原图先保存并可以立即访问，加水印等耗时操作交给线程池，处理完成后原子替换原文件 """
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import connections
+
+from PIL import Image, ImageDraw, ImageFont, features
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='imaging')
+
+# 各格式重新编码时的参数，未列出的格式（如动图GIF）不做处理
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85},
+}
+WEBP_SUPPORTED = features.check('webp')
+LANCZOS = getattr(Image, 'Resampling', Image).LANCZOS
+DERIVATIVE_RE = re.compile(r'-\d+w\.\w+$')  # 派生图的文件名，如 photo-640w.jpg、photo-640w.webp
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+
+
+def submit(path, blob_id):
+    """ 将按内容寻址保存的图片（config.MediaBlob）加入处理队列，返回Future """
+    future = executor.submit(_process_in_worker, path, blob_id)
+    future.add_done_callback(_log_error)
+    return future
+
+
+def process_blob(path, blob_id):
+    """
+    处理图片并记录处理完成的时间；处理失败时不记录，进程重启丢失的任务也没有记录，
+    都由 backfill_images --pending 重新处理
+    """
+    from config.models import MediaBlob  # 本模块在应用加载完成前就会被导入（见storage.py）
+
+    processed = process_image(path)
+    MediaBlob.mark_processed(blob_id)
+    return processed
+
+
+@lru_cache(maxsize=32)
+def load_font(family, size):
+    """ 字体文件只加载一次；找不到字体文件时使用Pillow自带的默认字体 """
+    try:
+        return ImageFont.truetype(family, size)
+    except OSError:
+        logger.warning('font %s not found, using the default font', family)
+        return ImageFont.load_default()
+
+
+def process_image(path):
+    """
+    为图片加水印并按原格式重新编码（JPEG仍为JPEG），超过IMAGE_MAX_SIDE的图片先缩小，再生成各宽度的派生图；
+    返回是否处理了该图片
+    """
+    with Image.open(path) as image:
+        image_format = image.format
+        if image_format not in SAVE_OPTIONS or getattr(image, 'is_animated', False):
+            return False
+        max_side = settings.IMAGE_MAX_SIDE
+        # JPEG解码时直接按2的幂缩小，超大照片不必以原尺寸全部载入内存
+        image.draft('RGB', (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        image = image.convert('RGB' if image_format == 'JPEG' else 'RGBA')
+
+    watermark_with_text(image, settings.WATERMARK_TEXT, settings.WATERMARK_COLOR, settings.WATERMARK_FONT)
+    _save(image, path, image_format)  # 处理完成前访问到的一直是完整的原图
+    _make_derivatives(image, path, image_format, overwrite=True)
+    return True
+
+
+def derivative_path(path, width, image_format=None):
+    """ 派生图与原图放在同一目录，如 photo.jpg -> photo-640w.jpg（WebP版本为photo-640w.webp）；也可用于URL """
+    stem, ext = os.path.splitext(path)
+    return '%s-%dw%s' % (stem, width, '.webp' if image_format == 'WEBP' else ext)
+
+
+def make_derivatives(path, overwrite=False):
+    """ 为已保存的图片生成派生图（供backfill_images命令使用），返回生成的文件数 """
+    with Image.open(path) as image:
+        image_format = image.format
+        if image_format not in SAVE_OPTIONS or getattr(image, 'is_animated', False):
+            return 0
+        widths = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < image.width]
+        if widths:
+            # 只需解码到最大派生宽度所需的尺寸
+            image.draft('RGB', (max(widths), max(round(image.height * max(widths) / image.width), 1)))
+        image.load()
+        return _make_derivatives(image, path, image_format, overwrite)
+
+
+def responsive_images(html):
+    """
+    将HTML中指向上传图片的<img>加上srcset、sizes（只使用已经生成的派生图）和loading="lazy"，
+    有WebP版本时外面再包一层<picture>；已有srcset的<img>保持不变，因此可以重复调用
+    """
+    return IMG_RE.sub(_rewrite_img, html)
+
+
+def media_path(url):
+    """ 将MEDIA_URL下的URL转换为文件路径，不是上传文件时返回None """
+    if not url.startswith(settings.MEDIA_URL) or '?' in url:
+        return None
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    path = os.path.abspath(os.path.join(media_root, unquote(url[len(settings.MEDIA_URL):])))
+    return path if path.startswith(media_root + os.sep) else None
+
+
+def watermark_with_text(image, text, color, fontfamily='Arial.ttf'):
+    """ 在图像底部居中绘制文字水印（直接修改image），fontfamily可以指定本地字体文件路径 """
+    draw = ImageDraw.Draw(image)  # 将图像创建为可以"画"的对象
+    width, height = image.size  # 图像的宽和高
+    margin = 10
+    font = load_font(fontfamily, max(int(height / 20), 1)) if fontfamily else ImageFont.load_default()
+    if hasattr(draw, 'textbbox'):  # Pillow 8.0+，新版本已移除textsize
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        text_width, text_height = right - left, bottom - top
+    else:
+        text_width, text_height = draw.textsize(text, font)
+    x = (width - text_width - margin) / 2  # 计算横轴位置
+    y = height - text_height - margin  # 计算纵轴位置
+    draw.text((x, y), text, color, font)
+    return image
+
+
+def _make_derivatives(image, path, image_format, overwrite):
+    """ 按IMAGE_DERIVATIVE_WIDTHS中比原图窄的宽度缩小，保存为原格式；Pillow支持WebP时再各存一份WebP（包括原宽度） """
+    formats = [image_format] + (['WEBP'] if WEBP_SUPPORTED and image_format != 'WEBP' else [])
+    count = 0
+    for width in sorted(set(settings.IMAGE_DERIVATIVE_WIDTHS) | {image.width}, reverse=True):
+        if width > image.width:
+            continue
+        # 原宽度只需要WebP版本
+        targets = [(fmt, derivative_path(path, width, fmt)) for fmt in formats if width < image.width or fmt == 'WEBP']
+        targets = [(fmt, target) for fmt, target in targets if overwrite or not os.path.exists(target)]
+        if not targets:
+            continue
+        if width == image.width:
+            resized = image
+        else:
+            resized = image.resize((width, max(round(image.height * width / image.width), 1)), LANCZOS)
+        for fmt, target in targets:
+            _save(resized, target, fmt)
+            count += 1
+    return count
+
+
+def _save(image, path, image_format):
+    """ 先写临时文件再替换 """
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    temp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+    image.save(temp_path, format=image_format, **SAVE_OPTIONS[image_format])
+    os.replace(temp_path, path)
+
+
+def _rewrite_img(match):
+    tag = match.group(0)
+    attrs = {name.lower(): value for name, value in ATTR_RE.findall(tag)}
+    if 'srcset' in attrs:
+        return tag
+    extra = {} if 'loading' in attrs else {'loading': 'lazy'}
+    src = attrs.get('src', '')
+    path = media_path(src)
+    webp_srcset = ''
+    original_width = _image_width(path) if path else None
+    if original_width:
+        candidates = [width for width in settings.IMAGE_DERIVATIVE_WIDTHS if width < original_width]
+        srcset = ['%s %dw' % (derivative_path(src, width), width)
+                  for width in candidates if os.path.exists(derivative_path(path, width))]
+        if srcset:
+            srcset.append('%s %dw' % (src, original_width))
+            extra.update(srcset=', '.join(srcset), sizes=settings.IMAGE_SIZES)
+        webp = ['%s %dw' % (derivative_path(src, width, 'WEBP'), width)
+                for width in candidates + [original_width] if os.path.exists(derivative_path(path, width, 'WEBP'))]
+        if webp and not src.lower().endswith('.webp'):
+            webp_srcset = ', '.join(webp)
+    if not extra:
+        return tag
+    end = '/>' if tag.endswith('/>') else '>'
+    new_tag = '%s %s%s' % (
+        tag[:-len(end)].rstrip(), ' '.join('%s="%s"' % (name, value) for name, value in extra.items()), end,
+    )
+    if webp_srcset:
+        new_tag = '<picture><source type="image/webp" srcset="%s" sizes="%s">%s</picture>' % (
+            webp_srcset, settings.IMAGE_SIZES, new_tag,
+        )
+    return new_tag
+
+
+def _image_width(path):
+    """ 只读取文件头；文件不存在或不是图片时返回None """
+    try:
+        with Image.open(path) as image:
+            return image.width
+    except OSError:
+        return None
+
+
+def _process_in_worker(path, blob_id):
+    try:
+        return process_blob(path, blob_id)
+    finally:
+        connections.close_all()  # 线程池中打开的数据库连接需要手动关闭
+
+
+def _log_error(future):
+    if future.exception() is not None:
+        logger.error('image processing failed', exc_info=future.exception())
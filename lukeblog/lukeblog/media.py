@@ -0,0 +1,178 @@
+""" 媒体文件（上传的图片等）的访问：支持条件GET和Range请求，可以把文件的发送交给前端服务器（Nginx/Apache） """
+import datetime
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from ckeditor_uploader.forms import SearchForm
+from ckeditor_uploader.utils import is_valid_image_extension
+from ckeditor_uploader.views import _get_user_path
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils._os import safe_join
+from django.utils.http import parse_etags, parse_http_date_safe, quote_etag
+
+from blog.conditional import conditional_response
+from config.models import MediaBlob, MediaReference
+
+from .storage import BLOB_DIR
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_processed_digests = set()  # 已处理完成的媒体文件不会再变为未处理，记在进程内，不必每次查询
+
+
+def serve_media(request, path):
+    """
+    返回MEDIA_ROOT下的文件。按内容寻址保存的文件（blobs/下）处理完成后内容不会再变化，允许客户端缓存一年；
+    设置了MEDIA_ACCEL_REDIRECT时只返回响应头，由前端服务器发送文件（Range也由它处理），
+    否则整个文件用FileResponse返回（WSGI服务器提供wsgi.file_wrapper时可以用sendfile零拷贝发送），Range请求返回206
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('文件不存在')
+    if not os.path.isfile(full_path):
+        raise Http404('文件不存在')
+
+    etag = '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+    last_modified = datetime.datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+    def get_response():
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        accel = settings.MEDIA_ACCEL_REDIRECT
+        if accel:
+            response = HttpResponse(content_type=content_type)
+            if accel == 'x-accel-redirect':
+                response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+            else:
+                response['X-Sendfile'] = full_path
+        else:
+            byte_range = _parse_range(request, stat.st_size, etag, stat.st_mtime)
+            if byte_range is None:
+                response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+            elif byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % stat.st_size
+                return response
+            else:
+                start, end = byte_range
+                response = StreamingHttpResponse(
+                    _read_range(full_path, start, end), status=206, content_type=content_type)
+                response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.st_size)
+                response['Content-Length'] = end - start + 1
+            response['Accept-Ranges'] = 'bytes'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Cache-Control'] = _cache_control(path)
+        return response
+
+    return conditional_response(request, lambda: (etag, last_modified), get_response)
+
+
+def _cache_control(path):
+    """
+    blobs/下的文件以内容摘要命名，但上传的图片会在后台加一次水印并替换原文件，
+    只有记录了处理完成的才允许永久缓存；处理完成前（包括任务丢失、等待重新处理的）每次都要重新验证
+    """
+    if not path.startswith(BLOB_DIR + '/'):
+        return 'public, max-age=%d' % settings.MEDIA_CACHE_MAX_AGE
+    if _is_processed(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return 'public, no-cache'
+
+
+def _is_processed(path):
+    """ 派生图（如<摘要>-640w.jpg）与原图在同一次处理中生成，都按文件名开头的摘要查询 """
+    digest = os.path.basename(path)[:64]
+    if digest not in _processed_digests:
+        if not MediaBlob.objects.filter(digest=digest, processed_time__isnull=False).exists():
+            return False
+        _processed_digests.add(digest)
+    return True
+
+
+def _parse_range(request, size, etag, mtime):
+    """
+    返回(起始字节, 结束字节)（都包含在内）；没有Range、格式不支持（如多个范围）或If-Range不匹配时返回None，即返回整个文件；
+    范围无法满足时返回False
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = RANGE_RE.match(header)
+    if request.method != 'GET' or not match:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if quote_etag(etag) not in parse_etags(if_range):
+                return None
+        elif parse_http_date_safe(if_range) != int(mtime):
+            return None
+
+    first, last = match.groups()
+    if not first:  # bytes=-500，最后500字节
+        if not last:
+            return None
+        if int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None  # 无效的范围，忽略Range
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(BLOCK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def browse_media(request):
+    """
+    代替ckeditor_uploader的“浏览服务器”：上传的文件按内容寻址保存在blobs/下，CKEDITOR_UPLOAD_PATH目录中没有文件，
+    因此按MediaReference中记录的上传文件名列出（同样内容的多次上传只列一次），沿用ckeditor_uploader的模板和搜索表单
+    """
+    prefix = settings.CKEDITOR_UPLOAD_PATH
+    if not request.user.is_superuser:
+        prefix = os.path.join(prefix, _get_user_path(request.user))  # 设置了CKEDITOR_RESTRICT_BY_USER时只列出自己的
+    references = MediaReference.objects.filter(
+        name__startswith=prefix.rstrip('/') + '/',
+    ).select_related('blob').order_by('-id')
+
+    files, blob_ids = [], set()
+    for reference in references:
+        if reference.blob_id in blob_ids:
+            continue
+        blob_ids.add(reference.blob_id)
+        url = default_storage.url(reference.blob.name)
+        files.append({
+            'thumb': url,
+            'src': url,
+            'is_image': is_valid_image_extension(url),
+            'visible_filename': os.path.basename(reference.name),
+        })
+
+    form = SearchForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        query = form.cleaned_data.get('q', '').lower()
+        files = [item for item in files if query in item['visible_filename'].lower()]
+    context = {'show_dirs': False, 'dirs': [], 'files': files, 'form': form}
+    return render(request, 'ckeditor/browse.html', context)
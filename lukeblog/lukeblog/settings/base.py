@@ -49,6 +49,102 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 CKEDITOR_UPLOAD_PATH = 'article_images'  # 富文本编辑器上传目录
 
+# 媒体文件的访问（见lukeblog/media.py）
+# 由前端服务器发送文件：None（由Django发送）、'x-accel-redirect'（Nginx）或'x-sendfile'（Apache mod_xsendfile）
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'  # Nginx中指向MEDIA_ROOT的internal location
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60  # 非内容寻址的文件（如旧的上传目录）允许客户端缓存的秒数
+MEDIA_SETTLE_SECONDS = 10 * 60  # 上传后超过该秒数仍未处理完成的图片视为任务已丢失，由 backfill_images --pending 重新处理
+
+# 上传图片的后台处理（见lukeblog/imaging.py）
+IMAGE_WORKERS = 2  # 处理图片的线程数
+IMAGE_MAX_SIDE = 4096  # 长边超过该像素数的图片先缩小再处理
+WATERMARK_TEXT = '@LukeBlog'
+WATERMARK_COLOR = 'red'
+WATERMARK_FONT = 'Arial.ttf'  # 字体文件路径，找不到时使用Pillow自带的默认字体
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1280]  # 为上传图片生成的派生图宽度（只生成比原图窄的），用于<img srcset>
+IMAGE_SIZES = '(max-width: 800px) 100vw, 800px'  # <img sizes>，正文区域最宽约800像素
+
+# 缓存：整页缓存、各集合的修改时间水位（blog/watermark.py）、世代号（blog/generation.py）等都要求各进程共享同一个缓存，
+# 默认的LocMemCache只在进程内有效，多进程部署时一个进程的修改不会让其他进程的缓存失效；
+# 默认使用同一台机器上各进程共享的文件缓存，部署在多台机器上时改为Memcached或Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '../../cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # 整页缓存按页面保存，默认的300条不够
+    },
+}
+
+# 文章pv/uv计数缓冲（见blog/counter.py）
+PVUV_FLUSH_INTERVAL = 10  # 批量写回数据库的周期（秒）
+PVUV_MAX_PENDING = 1000  # 累积的增量达到该数量时立即写回，即进程异常退出时最多丢失的增量数
+UV_HLL_PRECISION = 10  # 每篇文章每天的uv草图占2**10=1KB，估计误差约3.25%（见blog/hyperloglog.py）
+VISIT_BEACON_MAX_EVENTS = 20  # 访问统计beacon接口一次最多接受的事件数
+
+# 只有这些路径的响应才会下发uid Cookie（见blog/middleware/user_id.py），其余响应保持可被共享缓存
+UID_COOKIE_PATHS = ['/beacon/', '/comment/']
+
+# 热门文章排行（见blog/ranking.py）
+HOT_POSTS_SIZE = 10  # 列表长度N
+HOT_POSTS_UV_WEIGHT = 0  # 得分中uv的权重，得分 = (pv + 权重 * uv) / (发布小时数 + 2) ** 衰减指数
+HOT_POSTS_GRAVITY = 0  # 时间衰减指数，0为不衰减（即按pv排序）
+HOT_POSTS_TIMEOUT = 60 * 60  # 列表定期从数据库重建的周期（秒）
+
+# 站点公共部分（导航、侧边栏）快照的最长保留时间（秒），见blog/chrome.py
+CHROME_SNAPSHOT_TIMEOUT = 60
+
+# 匿名访问的整页缓存的过期时间（秒），数据变化时会立即清除受影响的页面，见blog/pagecache.py
+PAGE_CACHE_TIMEOUT = 10 * 60
+
+# 文章评论分页加载，每页的结果缓存在共享缓存中，评论变化时失效（见comment/models.py）
+COMMENT_PAGE_SIZE = 20
+COMMENT_CACHE_TIMEOUT = 60 * 60
+RECENT_COMMENTS_SIZE = 10  # “最近评论”侧边栏显示的条数（见comment/recent.py）
+
+# 评论提交先写入本地队列目录，由后台线程或 python manage.py process_comment_queue 批量写入数据库（见comment/queue.py）
+COMMENT_QUEUE_DIR = os.path.join(BASE_DIR, '../../comment_queue')
+COMMENT_QUEUE_CONSUMER = True  # 是否在Web进程中用定时器处理队列，由单独的进程运行命令处理时设为False
+COMMENT_QUEUE_INTERVAL = 5  # 提交后最多等待的秒数，期间的提交一起写入
+COMMENT_QUEUE_BATCH_SIZE = 500
+COMMENT_QUEUE_STALE_SECONDS = 10 * 60  # 取出后超过该秒数仍未处理完（消费者中途退出）的评论放回队列
+COMMENT_MAX_LINKS = 3  # 内容中的链接超过该数量时视为垃圾评论
+COMMENT_SPAM_WORDS = []  # 屏蔽词，内容、昵称或网站中包含任一屏蔽词时视为垃圾评论
+COMMENT_DEDUPE_SECONDS = 10 * 60  # 同一作者对同一目标在该秒数内提交的相同内容视为重复提交，只保留一条
+# 评论提交限流（令牌桶，见comment/ratelimit.py）：每个IP、每个uid最多连续提交BURST条，之后每分钟恢复RATE条
+COMMENT_RATE_BURST = 5
+COMMENT_RATE_PER_MINUTE = 2
+
+# 列表页前几页仍支持 ?page=N 翻页，之后改用游标（?after=id），见blog/pagination.py
+KEYSET_PAGE_LIMIT = 5
+
+# python manage.py audit_query_plans 允许的执行计划问题，格式为'表名:scan'（全表扫描）或'表名:temp-b-tree'（临时排序）
+QUERY_PLAN_ALLOWLIST = []
+
+# python manage.py benchmark 的基线文件和允许的p95耗时波动比例（见lukeblog/bench.py）
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, '../../benchmarks/baseline.json')
+BENCHMARK_TOLERANCE = 0.5
+
+# 站内搜索的倒排索引文件（见blog/search.py），可用 python manage.py rebuild_search_index 重建
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, '../../search_index.pickle')
+SEARCH_MAX_RESULTS = 200  # 搜索结果页最多展示的结果数
+SEARCH_INDEX_SAVE_DELAY = 5  # 索引修改后最多延迟该秒数写入磁盘，期间的多次修改只写一次
+SUGGEST_TOP_K = 10  # 搜索建议每类（文章、标签、分类）最多返回的条数，见blog/suggest.py
+
+# 站点的完整地址（如'https://www.example.com'）：预生成的文件（站点地图、RSS）不经过请求，其中的链接需要用它拼接；
+# 部署时必须设置，留空时生成这些文件会报错（ImproperlyConfigured），系统检查也会报错
+SITE_URL = ''
+
+# 预生成的分片站点地图（见blog/sitemap.py），文章变化时只重新生成所在的分片，可用 python manage.py build_sitemaps 全部重建
+SITEMAP_ROOT = os.path.join(BASE_DIR, '../../sitemaps')
+SITEMAP_SHARD_SIZE = 10000  # 每个分片包含的文章id范围，不能超过50000（单个站点地图的URL上限）
+SITEMAP_GZIP = True  # 同时生成gzip压缩版，客户端支持时直接返回
+
+# 预生成的RSS订阅源（见blog/rss.py），文章变化时重新生成相关的订阅源，可用 python manage.py build_feeds 全部重建
+FEED_ROOT = os.path.join(BASE_DIR, '../../feeds')
+FEED_SIZE = 5  # 每个订阅源包含的最新文章数
+FEED_GZIP = True
+
 # API组件配置
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
@@ -16,6 +16,8 @@ MIDDLEWARE += [
 
 INTERNAL_IPS = ['127.0.0.1', ]  # Django-Debug-Toolbar在本机调试
 
+SITE_URL = 'http://127.0.0.1:8000'  # 本机开发服务器的地址，用于预生成的站点地图和RSS中的链接
+
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
@@ -1,43 +1,54 @@
 """ 关于文件上传,储存于服务器的相关配置 """
-
-from io import BytesIO
+import hashlib
+import mimetypes
+import os
 
 from django.core.files.storage import FileSystemStorage
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.utils import timezone
+
+from . import imaging
 
-from PIL import Image, ImageDraw, ImageFont
+BLOB_DIR = 'blobs'
 
 
 class WatermarkStorage(FileSystemStorage):
-    """ 上传保存图片时添加水印 """
+    """
+    上传的文件按内容寻址保存：路径为 blobs/<摘要前2位>/<摘要3-4位>/<SHA-256摘要><扩展名>，同样内容只保存、处理一次；
+    图片在第一次保存后由后台线程池加水印（见imaging.py）。每次上传的原始文件名记录在config.MediaReference中
+    """
     def save(self, name, content, max_length=None):
-        """ 重写save,可以在文件上传保存前进行一些操作(如存储在CDN上等） """
-        # 为图像加水印
-        if 'image' in content.content_type:
-            image = self.watermark_with_text(content, '@LukeBlog', 'red')
-            content = self.convert_image_to_file(image, name)
-
-        return super().save(name, content, max_length=max_length)
-
-    def convert_image_to_file(self, image, name):
-        """ 将最终打上水印的图片对象Image转换为文件对象(即转换为BytesIO对象) """
-        temp = BytesIO()
-        image.save(temp, format='PNG')
-        file_size = temp.tell()
-        return InMemoryUploadedFile(temp, None, name, 'image/png', file_size, None)
-
-    def watermark_with_text(self, file_obj, text, color, fontfamily='Arial.ttf'):
-        """ 将上传的文件打上水印,并返回图片,fontfamily可以指定本地字体文件路径 """
-        image = Image.open(file_obj).convert('RGBA')  # 打开上传的文件,并转换为RGBA的图像
-        draw = ImageDraw.Draw(image)  # 将图像创建为可以"画"的对象
-        width, height = image.size  # 图像的宽和高
-        margin = 10
-        if fontfamily:
-            font = ImageFont.truetype(fontfamily, int(height / 20))
-        else:
-            font = None
-        textWidth, textHeight = draw.textsize(text, font)
-        x = (width - textWidth - margin) / 2  # 计算横轴位置
-        y = height - textHeight - margin  # 计算纵轴位置
-        draw.text((x, y), text, color, font)
-        return image
+        """ 重写save，返回实际保存的路径（同样内容的文件已存在时直接返回它的路径，不再写盘和处理图片） """
+        from config.models import MediaBlob, MediaReference  # 存储可能在应用加载完成前被实例化，在这里再导入模型
+
+        digest = self.hash_content(content)
+        blob_name = '%s/%s/%s/%s%s' % (BLOB_DIR, digest[:2], digest[2:4], digest, os.path.splitext(name)[1].lower())
+        is_image = self.is_image(blob_name, content)
+        blob = MediaBlob.objects.get_or_create(digest=digest, defaults={
+            'name': blob_name, 'size': content.size, 'processed_time': None if is_image else timezone.now(),
+        })[0]
+        if not self.exists(blob.name):
+            content.seek(0)
+            saved_name = self._save(blob.name, content)
+            if saved_name != blob.name:
+                # 并发上传同样的内容时，另一个请求已经写入了该路径，_save会改名另存，删除多余的这份
+                self.delete(saved_name)
+            elif is_image:
+                if blob.processed_time:  # 文件丢失后重新保存的是原图，需要重新处理
+                    MediaBlob.objects.filter(pk=blob.pk).update(processed_time=None)
+                imaging.submit(self.path(blob.name), blob.pk)  # 原图立即可以访问，处理完成前访问的是原图
+        MediaReference.objects.create(name=name, blob=blob)
+        return blob.name
+
+    @staticmethod
+    def hash_content(content):
+        sha256 = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def is_image(name, content):
+        """ 上传的文件有content_type，其他来源（如管理命令中保存的File对象）按文件名判断 """
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0] or ''
+        return content_type.startswith('image/')
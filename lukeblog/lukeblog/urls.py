@@ -14,18 +14,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 # --- 库 ---
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.cache import never_cache
 # import xadmin
 # from xadmin.plugins import xversion  # version模块自动注册需要版本控制的 Model
 import mgadmin
 from mgadmin.plugins import xversion
-from django.contrib.sitemaps import views as sitemap_views
-from django.views.decorators.cache import cache_page  # Django的缓存模块
 
-# 配置文件上传及访问路径(生产环境用Nginx完成)
+# 上传文件的访问路径（支持Range和条件GET，可以通过X-Accel-Redirect交给Nginx发送）
 from django.conf import settings
-from django.conf.urls.static import static
 
 # API路由库
 from rest_framework.routers import DefaultRouter
@@ -33,14 +32,14 @@ from rest_framework.documentation import include_docs_urls
 
 # --- View ---
 from blog.views import (
-    IndexView, CategoryView, TagView, PostDetailView, SearchView, AuthorView,
+    IndexView, CategoryView, TagView, PostDetailView, SearchView, AuthorView, VisitBeaconView, SitemapView,
+    FeedView,
 )
-from blog.rss import LatestPostFeed
-from blog.sitemap import PostSitemap
-from blog.apis import PostViewSet, CategoryViewSet
+from blog.apis import PostViewSet, CategoryViewSet, SearchViewSet, SuggestViewSet
 from config.views import LinkListView
-from comment.views import CommentView
+from comment.views import CommentView, CommentListView
 from .custom_site import custom_site  # 自定义站点（admin）
+from .media import browse_media, serve_media
 
 # xadmin.autodiscover()
 mgadmin.autodiscover()
@@ -50,6 +49,8 @@ xversion.register_models()  # version模块自动注册需要版本控制的 Mod
 router = DefaultRouter()
 router.register(r'post', PostViewSet, basename='api-post')  # 相当于设置PostViewSet的URL为/api/post
 router.register(r'category', CategoryViewSet, basename='api-category')  # 相当于设置CategoryViewSet的URL为/api/category
+router.register(r'search', SearchViewSet, basename='api-search')  # 站内搜索，URL为/api/search
+router.register(r'suggest', SuggestViewSet, basename='api-suggest')  # 搜索建议，URL为/api/suggest
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
@@ -58,19 +59,28 @@ urlpatterns = [
     path('search/', SearchView.as_view(), name='search'),
     path('author/<owner_id>', AuthorView.as_view(), name='author'),
     path('post/<int:post_id>.html', PostDetailView.as_view(), name='post-detail'),
-    path('rss/', LatestPostFeed(), name='rss'),
-    # 缓存有三个参数，第一个表示缓存时间（这里缓存20分钟有效），cache="default"默认即为使用默认缓存，key_prefix表示缓存秘钥前缀字符串，本质是返回装饰器
-    path('sitemap.xml', cache_page(60 * 20, key_prefix='sitemap_cache_')(sitemap_views.sitemap), {'sitemaps': {'posts': PostSitemap}}),
+    path('beacon/', VisitBeaconView.as_view(), name='visit-beacon'),
+    # RSS由文章变化时预先生成（见blog/rss.py），这里只返回文件，支持条件GET
+    path('rss/', FeedView.as_view(), name='rss'),
+    path('rss/category/<int:obj_id>/', FeedView.as_view(kind='category'), name='rss-category'),
+    path('rss/tag/<int:obj_id>/', FeedView.as_view(kind='tag'), name='rss-tag'),
+    # 站点地图由文章变化时预先生成（见blog/sitemap.py），这里只返回文件，支持条件GET
+    path('sitemap.xml', SitemapView.as_view(), name='sitemap'),
+    path('sitemap-<int:shard>.xml', SitemapView.as_view(), name='sitemap-shard'),
     path('comment/', CommentView.as_view(), name='comment'),
+    path('comments/', CommentListView.as_view(), name='comment-list'),  # 评论分页加载（HTML片段）
     path('links/', LinkListView.as_view(), name='links'),
     path('super_admin/', admin.site.urls, name='super-admin'),
     path('admin/', custom_site.urls, name='admin'),
     # path('xadmin/', xadmin.site.urls, name='xadmin'),
     path('mgadmin/', mgadmin.site.urls, name='mgadmin'),
+    # 上传的文件按内容寻址保存，“浏览服务器”改为按上传记录列出（见lukeblog/media.py），需在ckeditor_uploader的URL之前
+    path('ckeditor/browse/', never_cache(staff_member_required(browse_media)), name='media-browse'),
     path('ckeditor/', include('ckeditor_uploader.urls')),
     path('api/', include(router.urls)),
     path('api/docs/', include_docs_urls(title='lukeblog apis')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+]
 
 # 如果开启Debug模式，则增加Django-Debug-Toolbar的URL配置
 if settings.DEBUG: